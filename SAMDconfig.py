@@ -5,18 +5,41 @@ Main class to keep configuration data for SAMD board
 """
 
 import os
+import io
 import copy
 import shutil
 import stat
 import configparser
 import subprocess
 import glob
+import re
+import signal
+import time
+import threading
+import contextvars
+import functools
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
 from string import Template
 import hashlib
 import json
-from datetime import date
+import base64
+import zlib
+import struct
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import requests
-from packaging.version import Version
+from urllib3.util.retry import Retry
+from packaging.version import InvalidVersion, Version
+
+# resource is only available on Unix; without it subprocess CPU time is not recorded
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
 # Cloning the uf2 directory as part of the build creates read-only files which rmtree cannot
@@ -27,63 +50,1185 @@ def remove_readonly(func, path, _):
     func(path)
 
 
-# Source - https://stackoverflow.com/a/1144405
-# Posted by hughdbrown, modified by community. See post 'Timeline' for change history
-# Retrieved 2026-05-28, License - CC BY-SA 4.0
-
-from operator import itemgetter as i
-from functools import cmp_to_key
-
-
-def cmp(x, y):
-    """
-    Replacement for built-in function cmp that was removed in Python 3
+def write_if_changed(filename, contents):
+    "Write contents to filename unless the file already holds exactly that text"
+    if os.path.isfile(filename):
+        with open(filename, "r", encoding="UTF-8") as old_file:
+            if old_file.read() == contents:
+                return False
+    with open(filename, "w", encoding="UTF-8") as new_file:
+        new_file.write(contents)
+    return True
+
+
+# names of the files make left in directory that go into the package, for the bootloader
+# built as build_name, e.g. bootloader-stonefly_m4-v3.16.0
+# the linker map and the update-bootloader files are left out
+def bootloader_file_names(directory, build_name):
+    return sorted(
+        file_name
+        for file_name in os.listdir(directory)
+        if os.path.isfile(os.path.join(directory, file_name))
+        and build_name in file_name
+        and "map" not in file_name
+        and "update" not in file_name
+    )
+
+
+# A persistent on-disk cache of built bootloader files.
+# Each entry is a directory named by a hash of everything that goes into the build, so if
+# the key matches, the stored files can be used instead of running make.
+# The least recently used entries are deleted once the cache grows past max_size bytes.
+class BootloaderCache:
+    def __init__(self, cache_directory, max_size=200 * 1024 * 1024):
+        self.cache_directory = cache_directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    # compute the cache key from all of the inputs to the bootloader build
+    @staticmethod
+    def make_key(*inputs):
+        key_hash = hashlib.sha256()
+        for value in inputs:
+            key_hash.update(str(value).encode("UTF-8"))
+            # separate the inputs so that moving text between them changes the key
+            key_hash.update(b"\0")
+        return key_hash.hexdigest()
+
+    # copy the cached files for the key into dest_directory
+    # returns True on a cache hit, False on a miss
+    def restore(self, key, dest_directory):
+        entry_dir = os.path.join(self.cache_directory, key)
+        if not os.path.isdir(entry_dir) or not os.listdir(entry_dir):
+            self.misses += 1
+            return False
+        os.makedirs(dest_directory, exist_ok=True)
+        for file_name in os.listdir(entry_dir):
+            shutil.copy2(os.path.join(entry_dir, file_name), dest_directory)
+        # touch the entry so it counts as recently used for eviction
+        os.utime(entry_dir)
+        self.hits += 1
+        return True
+
+    # save the named bootloader files from src_directory under the key
+    def store(self, key, src_directory, file_names):
+        entry_dir = os.path.join(self.cache_directory, key)
+        # write into a temporary directory first so a partial entry is never used
+        tmp_dir = entry_dir + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, onexc=remove_readonly)
+        os.makedirs(tmp_dir)
+        for file_name in file_names:
+            shutil.copy2(os.path.join(src_directory, file_name), tmp_dir)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir, onexc=remove_readonly)
+        os.rename(tmp_dir, entry_dir)
+        self.evict()
+
+    # delete the least recently used entries until the cache fits in max_size
+    def evict(self):
+        entries = []
+        total_size = 0
+        for key in os.listdir(self.cache_directory):
+            entry_dir = os.path.join(self.cache_directory, key)
+            if not os.path.isdir(entry_dir):
+                continue
+            entry_size = sum(
+                os.path.getsize(os.path.join(entry_dir, f))
+                for f in os.listdir(entry_dir)
+            )
+            entries.append((os.path.getmtime(entry_dir), entry_size, entry_dir))
+            total_size += entry_size
+        for _, entry_size, entry_dir in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            print(f"Evicting {os.path.basename(entry_dir)} from the bootloader cache")
+            shutil.rmtree(entry_dir, onexc=remove_readonly)
+            total_size -= entry_size
+
+    def stats(self):
+        return f"Bootloader cache: {self.hits} hits, {self.misses} misses"
+
+
+# returns the SHA256 hash of a file's contents
+def file_sha256(filename):
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+# returns one SHA256 hash of the names and contents of every file under root_dir
+def tree_sha256(root_dir):
+    tree_hash = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for file_name in sorted(filenames):
+            full_file_name = os.path.join(dirpath, file_name)
+            relative_name = os.path.relpath(full_file_name, root_dir)
+            tree_hash.update(relative_name.replace(os.sep, "/").encode("UTF-8"))
+            tree_hash.update(b"\0")
+            tree_hash.update(file_sha256(full_file_name).encode("UTF-8"))
+    return tree_hash.hexdigest()
+
+
+# Cache of the board configs read by earlier builds, so that a board whose config file hasn't
+# changed doesn't have to be parsed and worked out again. Each board is saved as JSON under a
+# key made from the contents of its config file and the hash of this module, so any change to
+# how boards are read makes every entry stale. Entries not used by a build are removed.
+# The entries are also kept in memory, so a cache that outlives one build (as in the build
+# server) doesn't have to read them from disk again.
+class BoardConfigCache:
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+        self.hits = 0
+        self.misses = 0
+        self.used = set()
+        self.entries = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    # the cache key of a board config file
+    def make_key(self, filename):
+        return BootloaderCache.make_key(file_sha256(filename), tool_version())
+
+    # returns the saved state of the board for the key, or None on a miss
+    def load(self, key):
+        with self._lock:
+            self.used.add(key)
+            if key in self.entries:
+                self.hits += 1
+                return copy.deepcopy(self.entries[key])
+        try:
+            with open(
+                os.path.join(self.cache_directory, f"{key}.json"), "r", encoding="UTF-8"
+            ) as cache_file:
+                state = json.load(cache_file)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.entries[key] = copy.deepcopy(state)
+        return state
+
+    # saves the state of a board under the key
+    def store(self, key, state):
+        with self._lock:
+            self.entries[key] = copy.deepcopy(state)
+        filename = os.path.join(self.cache_directory, f"{key}.json")
+        # write to a temporary file first so a partial entry is never read
+        with open(filename + ".tmp", "w", encoding="UTF-8") as cache_file:
+            json.dump(state, cache_file)
+        os.replace(filename + ".tmp", filename)
+
+    # removes the entries this build didn't use and starts counting again for the next build
+    def prune(self):
+        for file_name in os.listdir(self.cache_directory):
+            if file_name.removesuffix(".json") not in self.used:
+                os.remove(os.path.join(self.cache_directory, file_name))
+        self.entries = {
+            key: state for key, state in self.entries.items() if key in self.used
+        }
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+
+# the SHA256 hash of this module, which changes whenever the way the package is built does
+@functools.cache
+def tool_version():
+    return file_sha256(os.path.abspath(__file__))
+
+
+# A manifest of the work a build has finished, so that a failed build can be resumed.
+# Each entry, e.g. a build stage or one board's bootloader, is saved with a key made from
+# its inputs and the SHA256 hashes of the files it produced. An entry only counts as done
+# if its key is unchanged and all of its files are still there with the same contents.
+# The manifest is saved after every change, so it is up to date even if the build crashes.
+class BuildCheckpoint:
+    def __init__(self, filename, resume=False):
+        self.filename = filename
+        self.entries = {}
+        self._lock = threading.Lock()
+        if resume and os.path.isfile(filename):
+            with open(filename, "r", encoding="UTF-8") as checkpoint_file:
+                self.entries = json.load(checkpoint_file)["entries"]
+        self.save()
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+            # write to a temporary file first so a crash never leaves half a manifest
+            with open(self.filename + ".tmp", "w", encoding="UTF-8") as checkpoint_file:
+                json.dump({"entries": self.entries}, checkpoint_file, indent=2)
+            os.replace(self.filename + ".tmp", self.filename)
+
+    # returns True if the entry was finished with this key and its files are unchanged
+    def done(self, name, key):
+        entry = self.entries.get(name)
+        if entry is None or entry["key"] != key:
+            return False
+        return all(
+            os.path.isfile(filename) and file_sha256(filename) == file_hash
+            for filename, file_hash in entry["files"].items()
+        )
 
-    Compare the two objects x and y and return an integer according to
-    the outcome. The return value is negative if x < y, zero if x == y
-    and strictly positive if x > y.
+    # values saved with the entry, for stages that set values other stages use
+    def values(self, name):
+        return self.entries[name]["values"]
 
-    https://portingguide.readthedocs.io/en/latest/comparisons.html#the-cmp-function
-    """
+    def record(self, name, key, files, values=None):
+        entry = {
+            "key": key,
+            "files": {filename: file_sha256(filename) for filename in files},
+            "values": values or {},
+        }
+        with self._lock:
+            self.entries[name] = entry
+        self.save()
+
+    def forget(self, name):
+        with self._lock:
+            removed = self.entries.pop(name, None)
+        if removed is not None:
+            self.save()
+
+
+# sort key for toolchain version directories such as 9-2019q4 or 10.3.1-2021.10,
+# comparing the numbers in the name in turn
+def toolchain_version_key(directory):
+    return [int(number) for number in re.findall(r"\d+", os.path.basename(directory))]
+
+
+# All of the _TEMPLATE files in the package template directory, each read and parsed once.
+# Templates are rendered from memory straight to their destinations, so they never have to
+# be copied into the build directory and deleted again.
+class PackageTemplates:
+    # templates under this path are rendered once for every board's variant directory
+    variant_prefix = "variants/variant_template/"
+
+    def __init__(self, template_directory):
+        self.template_directory = template_directory
+        self.templates = {}
+        for dp, dn, filenames in os.walk(template_directory):
+            for f in filenames:
+                if "_TEMPLATE" not in f:
+                    continue
+                # templates are named by their path within the template directory
+                name = os.path.relpath(os.path.join(dp, f), template_directory)
+                name = name.replace(os.sep, "/")
+                with open(os.path.join(dp, f), "r", encoding="UTF-8") as template_file:
+                    original = template_file.read()
+                template = Template(original)
+                self.templates[name] = {
+                    "template": template,
+                    "identifiers": frozenset(template.get_identifiers()),
+                    "text_hash": hashlib.sha256(original.encode("UTF-8")).hexdigest(),
+                }
+
+    def names(self):
+        return sorted(self.templates.keys())
+
+    # returns the placeholders in the template that have no value in the dictionary
+    def missing_values(self, name, sub_dict):
+        return sorted(self.templates[name]["identifiers"] - sub_dict.keys())
+
+    # hash of the template text and the values of only the placeholders it uses
+    def fingerprint(self, name, sub_dict):
+        fingerprint = hashlib.sha256(self.templates[name]["text_hash"].encode("UTF-8"))
+        for identifier in sorted(self.templates[name]["identifiers"]):
+            fingerprint.update(
+                f"\0{identifier}={sub_dict.get(identifier)}".encode("UTF-8")
+            )
+        return fingerprint.hexdigest()
+
+    def render(self, name, sub_dict):
+        return self.templates[name]["template"].substitute(sub_dict)
+
+
+# copytree ignore function that leaves out everything rendered from the package templates
+def ignore_templates(directory, names):
+    return [
+        name
+        for name in names
+        if "_TEMPLATE" in name or name in ["boards_header.txt", "variant_template"]
+    ]
+
+
+# Write-only file wrapper that keeps a SHA-256 hash and byte count of everything written.
+# write_reproducible_zip_entries only ever appends, since each member's size and CRC are
+# known before its header is written, so the hash is of exactly the bytes in the file.
+class HashingWriter:
+    def __init__(self, file_object):
+        self.file_object = file_object
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file_object.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+# Writes a reproducible zip archive of base_dir (relative to root_dir) to file_object.
+# Entries are sorted, every entry gets the same timestamp and fixed permissions, so the same
+# files always give the same bytes. Members are compressed on a thread pool (zlib releases
+# the GIL) and written in order; only a few members are held in memory at once. The archive
+# never seeks, so file_object can be a HashingWriter.
+def write_reproducible_zip(
+    file_object, root_dir, base_dir, compression_level=6, jobs=1, timestamp=None
+):
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root_dir, base_dir)):
+        arc_dirpath = os.path.relpath(dirpath, root_dir).replace(os.sep, "/")
+        entries.append((arc_dirpath + "/", None))
+        for name in filenames:
+            entries.append((f"{arc_dirpath}/{name}", os.path.join(dirpath, name)))
+    write_reproducible_zip_entries(
+        file_object, entries, compression_level, jobs, timestamp
+    )
+
+
+# Writes a reproducible zip archive of the entries, given as (name in the archive, source).
+# The source is the name of a file to read, the contents as bytes, or None for a directory,
+# whose name must end with "/".
+def write_reproducible_zip_entries(
+    file_object, entries, compression_level=6, jobs=1, timestamp=None
+):
+    if timestamp is None:
+        timestamp = source_date_epoch()
+    # zip timestamps are local DOS time and can't be before 1980
+    zip_time = max(time.gmtime(timestamp)[:6], (1980, 1, 1, 0, 0, 0))
+    dos_time = zip_time[3] << 11 | zip_time[4] << 5 | zip_time[5] // 2
+    dos_date = (zip_time[0] - 1980) << 9 | zip_time[1] << 5 | zip_time[2]
+    entries = sorted(entries, key=lambda entry: entry[0])
+
+    def compress_entry(entry):
+        arc_name, source = entry
+        if source is None:
+            return arc_name, b"", 0, 0, 0
+        if isinstance(source, bytes):
+            data = source
+        else:
+            with open(source, "rb") as member_file:
+                data = member_file.read()
+        crc = zlib.crc32(data)
+        if compression_level:
+            compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+            compressed = compressor.compress(data) + compressor.flush()
+        else:
+            compressed = data
+        return arc_name, compressed, crc, len(data), 8 if compression_level else 0
+
+    central_directory = []
+    offset = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        pending = deque()
+        entries_iter = iter(entries)
+        while True:
+            # keep a bounded number of members compressing ahead of the writer
+            while len(pending) < 2 * max(1, jobs):
+                entry = next(entries_iter, None)
+                if entry is None:
+                    break
+                pending.append(executor.submit(compress_entry, entry))
+            if not pending:
+                break
+            arc_name, compressed, crc, size, method = pending.popleft().result()
+            encoded_name = arc_name.encode("UTF-8")
+            flags = 0 if encoded_name.isascii() else 0x800
+            if offset + len(compressed) >= 0xFFFFFFFF or size >= 0xFFFFFFFF:
+                raise RuntimeError("The package archive is too large for a zip file")
+            file_object.write(
+                struct.pack(
+                    "<4s5H3L2H",
+                    b"PK\x03\x04",
+                    20,
+                    flags,
+                    method,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    len(compressed),
+                    size,
+                    len(encoded_name),
+                    0,
+                )
+            )
+            file_object.write(encoded_name)
+            file_object.write(compressed)
+            is_dir = arc_name.endswith("/")
+            # unix permissions in the high bits, MS-DOS directory flag in the low bits
+            external_attr = ((0o40755 if is_dir else 0o100644) << 16) | (
+                0x10 if is_dir else 0
+            )
+            central_directory.append(
+                struct.pack(
+                    "<4s6H3L5H2L",
+                    b"PK\x01\x02",
+                    (3 << 8) | 20,
+                    20,
+                    flags,
+                    method,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    len(compressed),
+                    size,
+                    len(encoded_name),
+                    0,
+                    0,
+                    0,
+                    0,
+                    external_attr,
+                    offset,
+                )
+                + encoded_name
+            )
+            offset += 30 + len(encoded_name) + len(compressed)
+
+    if len(central_directory) >= 0xFFFF:
+        raise RuntimeError("The package archive has too many files for a zip file")
+    central_directory_size = sum(len(record) for record in central_directory)
+    for record in central_directory:
+        file_object.write(record)
+    file_object.write(
+        struct.pack(
+            "<4s4H2LH",
+            b"PK\x05\x06",
+            0,
+            0,
+            len(central_directory),
+            len(central_directory),
+            central_directory_size,
+            offset,
+            0,
+        )
+    )
+
+
+# The time reproducible builds are stamped with, from the SOURCE_DATE_EPOCH environment
+# variable (https://reproducible-builds.org/specs/source-date-epoch/); without it, the time
+# of the latest commit, so that builds of the same sources are identical on any day.
+def source_date_epoch():
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        return int(os.environ["SOURCE_DATE_EPOCH"])
+    return source_time()
+
+
+# the time of the latest commit, or outside of a git checkout the newest modification time
+# of the board configs and package templates
+@functools.cache
+def source_time():
+    commit_time = subprocess.run(
+        ["git", "log", "-1", "--format=%ct"], capture_output=True, text=True
+    ).stdout.strip()
+    if commit_time:
+        return int(commit_time)
+    return int(
+        max(
+            (
+                os.path.getmtime(os.path.join(root, file_name))
+                for directory in ["board_data", "PACKAGE_TEMPLATE"]
+                for root, _, file_names in os.walk(directory)
+                for file_name in file_names
+            ),
+            default=0,
+        )
+    )
+
+
+def build_date():
+    return datetime.fromtimestamp(source_date_epoch(), timezone.utc).date().isoformat()
+
+
+# Keeps a destination tree in sync with a set of source files.
+# The files to copy are collected first and then copied on a thread pool, skipping any that
+# are already up to date. With link=True files are hard linked instead of copied where the
+# file system allows it. Afterwards, files in the tree that nothing put there can be removed.
+class TreeSync:
+    def __init__(self, jobs=1, link=False):
+        self.jobs = jobs
+        self.link = link
+        # destination -> source
+        self.files = {}
+        self.timings = {}
+
+    # add every file under src_dir, with the same layout under dest_dir
+    # ignore works like the ignore function for shutil.copytree
+    def add_tree(self, src_dir, dest_dir, ignore=None):
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            if ignore is not None:
+                ignored = set(ignore(dirpath, dirnames + filenames))
+                dirnames[:] = [name for name in dirnames if name not in ignored]
+                filenames = [name for name in filenames if name not in ignored]
+            rel_dirpath = os.path.relpath(dirpath, src_dir)
+            for name in filenames:
+                self.add_file(
+                    os.path.join(dirpath, name),
+                    os.path.normpath(os.path.join(dest_dir, rel_dirpath, name)),
+                )
 
-    return (x > y) - (x < y)
+    def add_file(self, src, dest):
+        self.files[os.path.normpath(dest)] = src
+
+    def sync_file(self, dest, src):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if self.link:
+            if os.path.exists(dest) and os.path.samefile(src, dest):
+                return False
+            try:
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                os.link(src, dest)
+                return True
+            except OSError:
+                # different file systems, or links not supported; fall back to copying
+                pass
+        if os.path.isfile(dest):
+            src_stat = os.stat(src)
+            dest_stat = os.stat(dest)
+            if (
+                src_stat.st_size == dest_stat.st_size
+                and src_stat.st_mtime_ns == dest_stat.st_mtime_ns
+            ):
+                return False
+        shutil.copy2(src, dest)
+        return True
+
+    # copy all of the added files; returns the number of files actually copied
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+            copied = sum(executor.map(self.sync_file, self.files, self.files.values()))
+        self.timings["copy"] = time.perf_counter() - start
+        print(
+            f"Synced {len(self.files)} files ({copied} copied, {len(self.files) - copied} already up to date) in {self.timings['copy']:.3f}s"
+        )
+        return copied
+
+    # deletes files under root_dir that were not synced and are not in keep, plus any
+    # directories left empty
+    # keep_prefixes are directories whose content is always kept
+    def remove_stale(self, root_dir, keep=(), keep_prefixes=()):
+        start = time.perf_counter()
+        expected = set(self.files) | {os.path.normpath(f) for f in keep}
+        keep_prefixes = tuple(os.path.normpath(p) + os.sep for p in keep_prefixes)
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(root_dir, topdown=False):
+            for name in filenames:
+                file_name = os.path.normpath(os.path.join(dirpath, name))
+                if file_name not in expected and not file_name.startswith(
+                    keep_prefixes
+                ):
+                    print(f"Removing stale file {file_name}")
+                    os.remove(file_name)
+                    removed += 1
+            if dirpath != root_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+        self.timings["remove_stale"] = time.perf_counter() - start
+        print(f"Removed {removed} stale files in {self.timings['remove_stale']:.3f}s")
+        return removed
+
+
+# The package directory held in memory instead of on disk, for streaming the package
+# straight into its archive. Each file is either rendered text kept in memory or a file on
+# disk that is only read when the archive is written. Paths are given as they would be on
+# disk, under root_dir.
+class PackageTree:
+    def __init__(self, root_dir):
+        self.root_dir = os.path.normpath(root_dir)
+        # path relative to root_dir -> file name or bytes
+        self.files = {}
+        self.directories = set()
+
+    def relative_name(self, dest):
+        return os.path.relpath(os.path.normpath(dest), self.root_dir).replace(
+            os.sep, "/"
+        )
 
+    def add_file(self, src, dest):
+        self.files[self.relative_name(dest)] = src
+
+    def add_text(self, dest, text):
+        self.files[self.relative_name(dest)] = text.encode("UTF-8")
+
+    # an empty directory, which would otherwise be left out
+    def add_directory(self, dest):
+        self.directories.add(self.relative_name(dest))
+
+    # the files and directories as entries for write_reproducible_zip_entries, in the
+    # directory base_dir of the archive
+    def zip_entries(self, base_dir):
+        directories = {""}
+        for name in list(self.files) + [name + "/" for name in self.directories]:
+            parent = os.path.dirname(name)
+            while parent not in directories:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+        entries = [
+            (f"{base_dir}/{directory}/" if directory else f"{base_dir}/", None)
+            for directory in directories
+        ]
+        entries += [
+            (f"{base_dir}/{name}", source) for name, source in self.files.items()
+        ]
+        return entries
+
+    # one SHA256 hash of the names and contents of every file
+    def sha256(self):
+        tree_hash = hashlib.sha256()
+        for name, source in sorted(self.files.items()):
+            tree_hash.update(name.encode("UTF-8"))
+            tree_hash.update(b"\0")
+            if isinstance(source, bytes):
+                tree_hash.update(hashlib.sha256(source).hexdigest().encode("UTF-8"))
+            else:
+                tree_hash.update(file_sha256(source).encode("UTF-8"))
+        return tree_hash.hexdigest()
+
+
+# Records wall time, CPU time, the CPU time of finished subprocesses and bytes read and
+# written for each stage of a build, and the same for each board within a stage.
+# Use as "with profiler.stage(name):"; a stage can also be run under cProfile and its
+# statistics dumped for later inspection with pstats or snakeviz.
+# Stages can run at the same time in different threads. The current stage is kept in a
+# context variable, so worker threads started by a stage must be given a copy of its context
+# for their board times to be recorded. CPU time and I/O are counted for the whole process,
+# so for a stage or board that overlapped another stage or board they would include the
+# other's work; they are left out (None) and the record is marked as overlapped.
+class BuildProfiler:
+    # the counters that are totals for the whole process
+    process_counters = ("cpu_s", "subprocess_cpu_s", "read_bytes", "write_bytes")
+
+    def __init__(self, profile_stage=None, profile_directory="."):
+        self.stages = []
+        self.profile_stage = profile_stage
+        self.profile_directory = profile_directory
+        self.created = time.perf_counter()
+        self._lock = threading.Lock()
+        self._current = contextvars.ContextVar("current_stage", default=None)
+        # the stages and boards being measured right now
+        self._measuring = []
+
+    # cumulative counters for this process
+    @staticmethod
+    def counters():
+        values = {
+            "wall_s": time.perf_counter(),
+            "cpu_s": time.process_time(),
+            "subprocess_cpu_s": None,
+            "read_bytes": None,
+            "write_bytes": None,
+        }
+        if resource is not None:
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            values["subprocess_cpu_s"] = children.ru_utime + children.ru_stime
+        # bytes read and written are only available from the Linux proc file system
+        if os.path.isfile("/proc/self/io"):
+            with open("/proc/self/io", "r", encoding="UTF-8") as io_file:
+                io_values = dict(
+                    line.split(": ") for line in io_file.read().splitlines()
+                )
+            values["read_bytes"] = int(io_values["rchar"])
+            values["write_bytes"] = int(io_values["wchar"])
+        return values
+
+    @contextmanager
+    def stage(self, name):
+        record = {"name": name, "boards": {}}
+        token = self._current.set(record)
+        profile = cProfile.Profile() if name == self.profile_stage else None
+        # peak memory is only known when tracemalloc is running, e.g. for benchmarks
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = self.start_measuring(record)
+        record["start_s"] = round(start["wall_s"] - self.created, 6)
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile_file = os.path.join(
+                    self.profile_directory, f"profile_{name}.prof"
+                )
+                os.makedirs(self.profile_directory, exist_ok=True)
+                profile.dump_stats(profile_file)
+                print(f"Saved profile of {name} to {profile_file}")
+            self.add_counters(record, start, self.stop_measuring(record))
+            if tracemalloc.is_tracing():
+                record["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            self._current.reset(token)
+            with self._lock:
+                self.stages.append(record)
+
+    # starts measuring a stage, or a board within the given stage; anything else being
+    # measured at the same time and the new record are marked as overlapped
+    def start_measuring(self, record, stage=None):
+        with self._lock:
+            others = [other for other in self._measuring if other is not stage]
+            for other in others:
+                other["overlapped"] = True
+            record["overlapped"] = record.get("overlapped", False) or bool(others)
+            self._measuring.append(record)
+        return self.counters()
+
+    def stop_measuring(self, record):
+        end = self.counters()
+        with self._lock:
+            self._measuring.remove(record)
+        return end
+
+    # adds the change in each counter from start to end to the record; the process wide
+    # counters are left out of an overlapped record
+    @classmethod
+    def add_counters(cls, record, start, end):
+        for key, value in end.items():
+            if (
+                value is None
+                or (key in record and record[key] is None)
+                or (key in cls.process_counters and record["overlapped"])
+            ):
+                record[key] = None
+            else:
+                record[key] = round(record.get(key, 0) + value - start[key], 6)
+
+    # records the counters for one board in the current stage, added up if the board is
+    # recorded more than once in the stage
+    # this is safe to call from worker threads running in a copy of the stage's context
+    @contextmanager
+    def board(self, board_name):
+        record = self._current.get()
+        if record is None:
+            yield
+            return
+        measured = {}
+        start = self.start_measuring(measured, record)
+        try:
+            yield
+        finally:
+            end = self.stop_measuring(measured)
+            with self._lock:
+                board_record = record["boards"].setdefault(
+                    board_name, {"overlapped": False}
+                )
+                board_record["overlapped"] |= measured["overlapped"]
+                self.add_counters(board_record, start, end)
+
+    def write_report(self, filename, critical_path=None):
+        report = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 6),
+            "elapsed_s": round(time.perf_counter() - self.created, 6),
+            "stages": self.stages,
+        }
+        if critical_path is not None:
+            report["critical_path"] = critical_path
+        with open(filename, "w", encoding="UTF-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Saved build timing report to {filename}")
+
+    def summary(self):
+        lines = ["Build stage timing:"]
+        for record in self.stages:
+            cpu = (
+                f"{'n/a':>10}"
+                if record["cpu_s"] is None
+                else f"{record['cpu_s']:9.3f}s"
+            )
+            lines.append(
+                f"  {record['name'].ljust(30)} {record['wall_s']:9.3f}s wall {cpu} CPU"
+            )
+        return "\n".join(lines)
+
+
+# Runs a set of tasks that depend on each other, each one as soon as everything it depends
+# on has finished, with up to jobs tasks running at the same time in a thread pool.
+# Tasks are started in the order they were added whenever more than one is ready, so with
+# one job the tasks run in exactly that order. If a task fails no new tasks are started;
+# the ones already running are allowed to finish and then the first error is raised.
+class TaskGraph:
+    def __init__(self):
+        self.tasks = {}
+        self.times = {}
+
+    def add(self, name, function, dependencies=(), description=None):
+        if name in self.tasks:
+            raise RuntimeError(f"Task {name} is already in the graph")
+        self.tasks[name] = {
+            "function": function,
+            "dependencies": list(dependencies),
+            "description": description or name,
+        }
 
-def multikeysort(items, columns, functions={}, getter=i):
-    """Sort a list of dictionary objects or objects by multiple keys bidirectionally.
-    Keyword Arguments:
-    items -- A list of dictionary objects or objects
-    columns -- A list of column names to sort by. Use -column to sort in descending order
-    functions -- A Dictionary of Column Name -> Functions to normalize or process each column value
-    getter -- Default "getter" if column function does not exist
-              operator.itemgetter for Dictionaries
-              operator.attrgetter for Objects
-    """
-    comparers = []
-    for col in columns:
-        column = col[1:] if col.startswith("-") else col
-        if not column in functions:
-            functions[column] = getter(column)
-        comparers.append((functions[column], 1 if column == col else -1))
+    # returns the task names in an order that satisfies every dependency
+    def order(self):
+        for name, task in self.tasks.items():
+            for dependency in task["dependencies"]:
+                if dependency not in self.tasks:
+                    raise RuntimeError(
+                        f"Task {name} depends on unknown task {dependency}"
+                    )
+        ordered = []
+        remaining = dict(self.tasks)
+        while remaining:
+            ready = [
+                name
+                for name, task in remaining.items()
+                if all(dependency in ordered for dependency in task["dependencies"])
+            ]
+            if not ready:
+                raise RuntimeError(
+                    f"Dependency cycle between the tasks {', '.join(remaining)}"
+                )
+            for name in ready:
+                ordered.append(name)
+                del remaining[name]
+        return ordered
+
+    # run_task, if given, is called as run_task(name, description, function) to run each
+    # task, e.g. to time it; otherwise the task function is just called
+    def run(self, jobs=1, run_task=None):
+        self.order()
+        self.times = {}
+        self.start = time.perf_counter()
+        waiting = dict(self.tasks)
+        finished = set()
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            while waiting or running:
+                if error is None:
+                    ready = [
+                        name
+                        for name, task in waiting.items()
+                        if all(d in finished for d in task["dependencies"])
+                    ]
+                    for name in ready:
+                        del waiting[name]
+                        # each task gets its own copy of the caller's context
+                        future = executor.submit(
+                            contextvars.copy_context().run,
+                            self.run_one,
+                            name,
+                            run_task,
+                        )
+                        running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        finished.add(name)
+                    except Exception as e:
+                        print(f"Task {name} failed: {e!r}")
+                        if error is None:
+                            error = e
+        if error is not None:
+            raise error
+
+    def run_one(self, name, run_task=None):
+        task = self.tasks[name]
+        start = time.perf_counter()
+        try:
+            if run_task is None:
+                task["function"]()
+            else:
+                run_task(name, task["description"], task["function"])
+        finally:
+            self.times[name] = (start - self.start, time.perf_counter() - self.start)
+
+    # the chain of dependent tasks with the longest total run time, which sets the
+    # shortest possible time for the whole graph however many jobs are used
+    # returns a list of (task name, seconds)
+    def critical_path(self):
+        path_time = {}
+        previous = {}
+        for name in self.order():
+            if name not in self.times:
+                continue
+            start, end = self.times[name]
+            path_time[name] = end - start
+            timed_dependencies = [
+                d for d in self.tasks[name]["dependencies"] if d in path_time
+            ]
+            if timed_dependencies:
+                previous[name] = max(timed_dependencies, key=path_time.get)
+                path_time[name] += path_time[previous[name]]
+        if not path_time:
+            return []
+        path = [max(path_time, key=path_time.get)]
+        while path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return [
+            (name, round(self.times[name][1] - self.times[name][0], 6)) for name in path
+        ]
 
-    def comparer(left, right):
-        for func, polarity in comparers:
-            result = cmp(func(left), func(right))
-            if result:
-                return polarity * result
+    def elapsed(self):
+        return max((end for start, end in self.times.values()), default=0)
+
+    def critical_path_summary(self):
+        path = self.critical_path()
+        total = sum(seconds for name, seconds in path)
+        lines = [f"Critical path: {total:.3f}s of {self.elapsed():.3f}s elapsed"]
+        for name, seconds in path:
+            lines.append(f"  {name.ljust(30)} {seconds:9.3f}s")
+        return "\n".join(lines)
+
+
+# stops a process started with start_new_session, along with everything it started
+def stop_process(process):
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
         else:
-            return 0
+            process.terminate()
+    except ProcessLookupError:
+        pass
+
+
+# Follows the make processes of the bootloader builds while they run.
+# Each line of output is checked for compiler, linker and make errors as soon as it arrives.
+# With output "all" every line is shown on the console, with "errors" (the default) only the
+# errors and with "none" nothing. In fail-fast mode the first error stops all of the other
+# running builds and the builds that have not started yet are skipped.
+class BuildMonitor:
+    error_pattern = re.compile(r"\berror:|\*\*\*|undefined reference")
+
+    def __init__(self, output="errors", fail_fast=False):
+        self.output = output
+        self.fail_fast = fail_fast
+        self.cancelled = threading.Event()
+        self.processes = {}
+        self.start_times = {}
+        self.durations = {}
+        self.errors = {}
+        self.stopped = set()
+        self._lock = threading.Lock()
+
+    def started(self, board_name, process):
+        with self._lock:
+            self.processes[board_name] = process
+            self.start_times[board_name] = time.perf_counter()
+        # a build that starts just as another one fails is stopped straight away
+        if self.cancelled.is_set():
+            self.stop(board_name, process)
+
+    def line(self, board_name, line):
+        is_error = self.error_pattern.search(line) is not None
+        if self.output == "all" or (is_error and self.output == "errors"):
+            print(f"[{board_name}] {line.rstrip()}")
+        if is_error:
+            with self._lock:
+                self.errors.setdefault(board_name, line.strip())
+            if self.fail_fast:
+                self.cancel(board_name)
+
+    def finished(self, board_name, returncode):
+        with self._lock:
+            self.processes.pop(board_name, None)
+            self.durations[board_name] = (
+                time.perf_counter() - self.start_times[board_name]
+            )
+        # make can also fail without printing anything that looks like an error
+        if returncode and self.fail_fast:
+            self.cancel(board_name)
+
+    # stops every build other than the one for failed_board
+    def cancel(self, failed_board):
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            running = [
+                (name, process)
+                for name, process in self.processes.items()
+                if name != failed_board
+            ]
+        print(f"Bootloader for {failed_board} failed, stopping the other builds")
+        for board_name, process in running:
+            self.stop(board_name, process)
+
+    # builds on a bootloader worker have no local process and can't be stopped from here
+    def stop(self, board_name, process):
+        with self._lock:
+            self.stopped.add(board_name)
+        if process is not None:
+            stop_process(process)
+
+    # marks a build that was never started because of an earlier failure
+    def skip(self, board_name):
+        with self._lock:
+            self.stopped.add(board_name)
+
+
+# HTTP client shared by everything that talks to GitHub.
+# One requests session pools the connections; every request has a timeout and is retried
+# with backoff on connection errors and server errors. Successful responses are cached on
+# disk with their ETag and Last-Modified headers, so later requests are conditional and an
+# unchanged resource comes back as a 304 with no body. Within max_age seconds of the last
+# fetch, and always when offline, the cached response is used without any request. It is
+# also used whenever a request fails or gets any answer other than 200 or 304.
+class CachedHttpClient:
+    def __init__(self, cache_directory, timeout=10, retries=3, offline=False):
+        self.cache_directory = cache_directory
+        self.timeout = timeout
+        self.offline = offline
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def cache_files(self, url):
+        url_hash = hashlib.sha256(url.encode("UTF-8")).hexdigest()
+        return (
+            os.path.join(self.cache_directory, url_hash + ".json"),
+            os.path.join(self.cache_directory, url_hash + ".body"),
+        )
 
-    return sorted(items, key=cmp_to_key(comparer))
+    # returns the cached info and body for the url, or (None, None)
+    def read_cache(self, url):
+        info_file, body_file = self.cache_files(url)
+        if not (os.path.isfile(info_file) and os.path.isfile(body_file)):
+            return None, None
+        with open(info_file, "r", encoding="UTF-8") as cache_file:
+            cache_info = json.load(cache_file)
+        with open(body_file, "rb") as cache_file:
+            return cache_info, cache_file.read()
+
+    def write_cache(self, url, cache_info, body=None):
+        os.makedirs(self.cache_directory, exist_ok=True)
+        info_file, body_file = self.cache_files(url)
+        if body is not None:
+            with open(body_file, "wb") as cache_file:
+                cache_file.write(body)
+        with open(info_file, "w", encoding="UTF-8") as cache_file:
+            json.dump(cache_info, cache_file, indent=2)
+
+    # fetches the url, using and updating the cache
+    # returns (status code, body); the status is 200 whenever the body comes from the cache
+    def get(self, url, max_age=0):
+        cache_info, cached_body = self.read_cache(url)
+        if self.offline:
+            if cache_info is None:
+                raise RuntimeError(f"Offline and nothing cached for {url}")
+            print(f"Offline, using the cached copy of {url}")
+            return 200, cached_body
+        if cache_info is not None and time.time() - cache_info["fetched"] < max_age:
+            print(f"Using the recently cached copy of {url}")
+            return 200, cached_body
+
+        headers = {}
+        if cache_info is not None:
+            if cache_info.get("etag"):
+                headers["If-None-Match"] = cache_info["etag"]
+            if cache_info.get("last_modified"):
+                headers["If-Modified-Since"] = cache_info["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            if cache_info is None:
+                raise
+            print(f"Request for {url} failed ({e}), using the cached copy")
+            return 200, cached_body
+
+        if response.status_code == 304 and cache_info is not None:
+            # nothing has changed since the cached response
+            print(f"{url} is unchanged, using the cached copy")
+            cache_info["fetched"] = time.time()
+            self.write_cache(url, cache_info)
+            return 200, cached_body
+        if response.status_code == 200:
+            self.write_cache(
+                url,
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag", ""),
+                    "last_modified": response.headers.get("Last-Modified", ""),
+                    "fetched": time.time(),
+                },
+                response.content,
+            )
+            return 200, response.content
+        # any other answer, like GitHub's 403 or 429 when the rate limit is reached, falls
+        # back to the cached copy if there is one
+        if cache_info is not None:
+            print(
+                f"Request for {url} returned status {response.status_code}, using the cached copy"
+            )
+            return 200, cached_body
+        return response.status_code, response.content
 
 
 # The class for a single board configuration
 class SAMDBoard:
+    # the chip variants each chip family can be built for
+    supported_chip_variants = {
+        "SAMD21": [
+            "SAMD21E17A",
+            "SAMD21E18A",
+            "SAMD21G17A",
+            "SAMD21G18A",
+            "SAMD21J18A",
+        ],
+        "SAMD51": [
+            "SAMD51G18A",
+            "SAMD51G19A",
+            "SAMD51J18A",
+            "SAMD51J19A",
+            "SAMD51J20A",
+            "SAMD51N19A",
+            "SAMD51N20A",
+            "SAMD51P19A",
+            "SAMD51P20A",
+        ],
+        "SAME51": [
+            "SAME51J18A",
+            "SAME51J19A",
+            "SAME51J20A",
+            "SAME51N19A",
+            "SAME51N20A",
+            "SAME53J18A",
+            "SAME53J19A",
+            "SAME53J20A",
+            "SAME53N19A",
+            "SAME53N20A",
+            "SAME54N19A",
+            "SAME54N20A",
+            "SAME54P19A",
+            "SAME54P20A",
+        ],
+    }
+
     # constructor
     def __init__(self, filename):
         # dictionary containing all config data
         self.d = {}
-        self.d["build_date"] = date.today().isoformat()
+        self.d["build_date"] = build_date()
         # read all values from main sections of config file
         config_file = configparser.ConfigParser()
         config_file.read(filename)
@@ -182,6 +1327,8 @@ class SAMDBoard:
                 self.d["maximum_size"] = (
                     262144  # 0x00040000, including bootloader space
                 )
+            else:
+                raise RuntimeError(f"Unsupported chip variant {self.chip_variant}")
             self.d["build_mcu"] = "cortex-m4"
             self.d["f_cpu"] = "120000000L"
             self.d[
@@ -232,135 +1379,226 @@ class SAMDBoard:
             " " + config_file["additional_build_flags"]["extra_extra_flags"]
         )
 
+    # reports every empty value before raising an error
     def check_missing_values(self, dictionary):
-        for key, value in dictionary.items():
-            if not value:
-                print(f"No value provided for {key}")
-                raise RuntimeError("Missing configuration parameters")
+        missing = [key for key, value in dictionary.items() if not value]
+        for key in missing:
+            print(f"No value provided for {key}")
+        if missing:
+            raise RuntimeError(
+                f"Missing configuration parameters: {', '.join(missing)}"
+            )
+
+    # everything read and worked out from the config file, for BoardConfigCache
+    def state(self):
+        return dict(vars(self))
+
+    # a board with the state saved by state(), without reading the config file again
+    @classmethod
+    def from_state(cls, state):
+        board = cls.__new__(cls)
+        vars(board).update(state)
+        board.d["build_date"] = build_date()
+        return board
+
+    # the contents of the board.mk file needed to make/build the bootloader
+    def board_mk_contents(self):
+        board_mk = io.StringIO()
+        board_mk.write("CHIP_FAMILY = " + self.d["chip_family"].lower() + "\n")
+        board_mk.write("CHIP_VARIANT = " + self.d["chip_variant"] + "\n")
+        return board_mk.getvalue()
 
     # creates board.mk file in given directory
     # this is needed to make/build the bootloader
     def write_board_mk(self, dest_directory):
         print(f"Writing board.mk file to {dest_directory}/board.mk")
-        with open(f"{dest_directory}/board.mk", "w", encoding="UTF-8") as board_mk:
-            board_mk.write("CHIP_FAMILY = " + self.d["chip_family"].lower() + "\n")
-            board_mk.write("CHIP_VARIANT = " + self.d["chip_variant"] + "\n")
+        # unchanged files are not rewritten, so make does not rebuild a resumed build
+        write_if_changed(f"{dest_directory}/board.mk", self.board_mk_contents())
+
+    # the contents of the board_config.h file used to make/build the bootloader
+    def board_config_contents(self, package_dict):
+        board_config = io.StringIO()
+        board_config.write("#ifndef BOARD_CONFIG_H\n")
+        board_config.write("#define BOARD_CONFIG_H\n\n")
+        board_config.write(
+            '#define VENDOR_NAME      "' + package_dict["vendor_name_long"] + '"\n'
+        )
+        board_config.write(
+            '#define PRODUCT_NAME     "' + self.d["board_name_long"] + '"\n'
+        )
+        board_config.write(
+            '#define VOLUME_LABEL     "' + self.d["volume_label"] + '"\n'
+        )
+        board_config.write(
+            '#define INDEX_URL        "' + package_dict["info_url"] + '"\n\n'
+        )
+        board_id = (
+            self.chip_variant
+            + "-"
+            + self.d["board_define_name"]
+            + f"-v{self.board_version}"
+        )
+        board_config.write('#define BOARD_ID         "' + board_id + '"\n\n')
+        board_config.write("#define USB_VID          " + self.d["usb_vid"] + "\n")
+        board_config.write("#define USB_PID          " + self.d["usb_pid"] + "\n")
+        if "crystalless" in self.d.keys() and self.d["crystalless"] != "0":
+            board_config.write("#define CRYSTALLESS      1\n\n")
+        if "led_pin" in self.d:
+            board_config.write("#define LED_PIN          " + self.d["led_pin"] + "\n")
+        if "led_tx_pin" in self.d and "led_rx_pin" in self.d:
+            board_config.write(
+                "#define LED_TX_PIN          " + self.d["led_tx_pin"] + "\n"
+            )
+            board_config.write(
+                "#define LED_RX_PIN          " + self.d["led_rx_pin"] + "\n\n"
+            )
+        else:
+            board_config.write("\n")
 
-    # creates board_config.h file in given directory
-    # this is used to make/build the bootloader
-    def write_board_config(self, dest_directory, package_dict):
-        print(f"Writing board_config.h file to {dest_directory}/board_config.h")
-        with open(
-            f"{dest_directory}/board_config.h", "w", encoding="UTF-8"
-        ) as board_config:
-            board_config.write("#ifndef BOARD_CONFIG_H\n")
-            board_config.write("#define BOARD_CONFIG_H\n\n")
+        if "board_neopixel_pin" in self.d:
             board_config.write(
-                '#define VENDOR_NAME      "' + package_dict["vendor_name_long"] + '"\n'
+                "#define BOARD_NEOPIXEL_PIN   " + self.d["board_neopixel_pin"] + "\n"
             )
             board_config.write(
-                '#define PRODUCT_NAME     "' + self.d["board_name_long"] + '"\n'
+                "#define BOARD_NEOPIXEL_COUNT   "
+                + self.d["board_neopixel_count"]
+                + "\n\n"
             )
+        if "board_rgbled_clock_pin" in self.d:
             board_config.write(
-                '#define VOLUME_LABEL     "' + self.d["volume_label"] + '"\n'
+                "#define BOARD_RGBLED_CLOCK_PIN   "
+                + self.d["board_rgbled_clock_pin"]
+                + "\n"
             )
             board_config.write(
-                '#define INDEX_URL        "' + package_dict["info_url"] + '"\n\n'
-            )
-            board_id = (
-                self.chip_variant
-                + "-"
-                + self.d["board_define_name"]
-                + f"-v{self.board_version}"
-            )
-            board_config.write('#define BOARD_ID         "' + board_id + '"\n\n')
-            board_config.write("#define USB_VID          " + self.d["usb_vid"] + "\n")
-            board_config.write("#define USB_PID          " + self.d["usb_pid"] + "\n")
-            if "crystalless" in self.d.keys() and self.d["crystalless"] != "0":
-                board_config.write("#define CRYSTALLESS      1\n\n")
-            if "led_pin" in self.d:
-                board_config.write(
-                    "#define LED_PIN          " + self.d["led_pin"] + "\n"
-                )
-            if "led_tx_pin" in self.d and "led_rx_pin" in self.d:
-                board_config.write(
-                    "#define LED_TX_PIN          " + self.d["led_tx_pin"] + "\n"
-                )
-                board_config.write(
-                    "#define LED_RX_PIN          " + self.d["led_rx_pin"] + "\n\n"
-                )
-            else:
-                board_config.write("\n")
-
-            if "board_neopixel_pin" in self.d:
-                board_config.write(
-                    "#define BOARD_NEOPIXEL_PIN   "
-                    + self.d["board_neopixel_pin"]
-                    + "\n"
-                )
-                board_config.write(
-                    "#define BOARD_NEOPIXEL_COUNT   "
-                    + self.d["board_neopixel_count"]
-                    + "\n\n"
-                )
-            if "board_rgbled_clock_pin" in self.d:
-                board_config.write(
-                    "#define BOARD_RGBLED_CLOCK_PIN   "
-                    + self.d["board_rgbled_clock_pin"]
-                    + "\n"
-                )
-                board_config.write(
-                    "#define BOARD_RGBLED_DATA_PIN   "
-                    + self.d["board_rgbled_data_pin"]
-                    + "\n\n"
-                )
-
-            # now, add extras
-            for key, value in self.extras.items():
-                padded_key = key.ljust(27).upper()
-                board_config.write(f"#define {padded_key} {value}\n")
-            board_config.write("#endif\n")
-
-    def build_bootloader(self, new_env=None):
-        print(f"Starting GNU make for {self.name}...")
-        with open(
-            f"../{self.name}_bootloader_build_log.txt", "a", encoding="UTF-8"
-        ) as logfile:
-            print(f"Logging build output to ../{self.name}_bootloader_build_log.txt")
-            command = f"make BOARD={self.name} VERSION={self.board_version} VERBOSE=1"
-            print(f"Running make command: {command}")
-            make_process = subprocess.run(
+                "#define BOARD_RGBLED_DATA_PIN   "
+                + self.d["board_rgbled_data_pin"]
+                + "\n\n"
+            )
+
+        # now, add extras
+        for key, value in self.extras.items():
+            padded_key = key.ljust(27).upper()
+            board_config.write(f"#define {padded_key} {value}\n")
+        board_config.write("#endif\n")
+        return board_config.getvalue()
+
+    # creates board_config.h file in given directory
+    # this is used to make/build the bootloader
+    def write_board_config(self, dest_directory, package_dict):
+        print(f"Writing board_config.h file to {dest_directory}/board_config.h")
+        write_if_changed(
+            f"{dest_directory}/board_config.h",
+            self.board_config_contents(package_dict),
+        )
+
+    # runs make for the board in the uf2 repo, without a shell, streaming its output into
+    # the board's log file and to the monitor as it is printed
+    # compiler_launcher is a compiler cache like ccache to run the compiler through
+    # returns True if the build succeeded
+    def build_bootloader(
+        self,
+        new_env=None,
+        uf2_directory=".",
+        make_jobs=None,
+        quiet=False,
+        monitor=None,
+        compiler_launcher=None,
+    ):
+        if monitor is None:
+            monitor = BuildMonitor()
+        # the build log is kept next to the uf2 repo, one file per board
+        log_filename = os.path.join(
+            uf2_directory, "..", f"{self.name}_bootloader_build_log.txt"
+        )
+        if not quiet:
+            print(f"Starting GNU make for {self.name}...")
+        with open(log_filename, "w", encoding="UTF-8") as logfile:
+            if not quiet:
+                print(f"Logging build output to {log_filename}")
+            command = [
+                "make",
+                f"BOARD={self.name}",
+                f"VERSION={self.board_version}",
+                "VERBOSE=1",
+            ]
+            if make_jobs and int(make_jobs) > 1:
+                command.append(f"-j{int(make_jobs)}")
+            if compiler_launcher:
+                # overrides the compiler set in the uf2 Makefile
+                command.append(f"CC={compiler_launcher} arm-none-eabi-gcc")
+            if not quiet:
+                print(f"Running make command: {' '.join(command)}")
+            # look for make on the PATH of the build environment, not this process
+            command[0] = (
+                shutil.which("make", path=(new_env or os.environ).get("PATH")) or "make"
+            )
+            # make and its compilers get their own process group, so they can all be stopped
+            make_process = subprocess.Popen(
                 command,
-                shell=True,
+                cwd=uf2_directory,
                 env=new_env,
-                stdout=logfile,
+                stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 text=True,
+                encoding="UTF-8",
+                errors="replace",
+                bufsize=1,
+                start_new_session=True,
             )
-            if make_process.returncode:
-                print(
-                    f"Making bootloader failed for {self.name}. Please see the log file ../{self.name}_bootloader_build_log.txt for details"
-                )
+            monitor.started(self.name, make_process)
+            for line in make_process.stdout:
+                logfile.write(line)
+                monitor.line(self.name, line)
+            returncode = make_process.wait()
+            monitor.finished(self.name, returncode)
+            if returncode:
+                if not quiet:
+                    print(
+                        f"Making bootloader failed for {self.name}. Please see the log file {log_filename} for details"
+                    )
+                return False
             else:
-                print(f"Successfully built bootloader for {self.name}")
+                if not quiet:
+                    print(f"Successfully built bootloader for {self.name}")
+                return True
 
 
 # The class for the whole package, containing multiple board configurations
 class SAMDPackage:
+    # the [build] settings that change what is built rather than how the build runs
+    output_build_settings = ["uf2_repo_url", "uf2_version_tag"]
+
     # constructor
-    def __init__(self, dirname):
+    # with check, configuration errors are collected in config_errors for preflight_check
+    # instead of stopping at the first one
+    # config_cache is a BoardConfigCache to read the boards through instead of the one in
+    # the cache directory
+    def __init__(self, dirname, check=False, config_cache=None):
         print(f"Reading package config from {dirname}")
         self.config_directory = dirname
+        self.check = check
+        self.config_errors = []
         self.boards_config: list[SAMDBoard] = []
         # dictionary containing all config data
         self.d = {}
-        self.d["build_date"] = date.today().isoformat()
+        # the sources may have changed since a package was last made in this process
+        source_time.cache_clear()
+        self.d["build_date"] = build_date()
         # read all values from main sections of config file
         config_file = configparser.ConfigParser()
         config_file.read(os.path.join(dirname, "package-config.ini"))
         for s in ["vendor", "package", "paths"]:
+            if not config_file.has_section(s):
+                self.config_error(f"package-config.ini: no [{s}] section")
+                continue
             for key, value in config_file[s].items():
                 self.d[key] = value
+        # the build section is optional; anything left out or left empty uses the defaults
+        if config_file.has_section("build"):
+            for key, value in config_file["build"].items():
+                if value:
+                    self.d[key] = value
 
         # Fill in missing values that are allowed to be blank based on other values
         for key, value in self.d.items():
@@ -370,27 +1608,93 @@ class SAMDPackage:
                 )
 
         # check for empty values
-        self.check_missing_values(self.d)
+        try:
+            self.check_missing_values(self.d)
+        except RuntimeError as e:
+            if not check:
+                raise
+            self.config_errors.append(f"package-config.ini: {e}")
 
         # define common properties
-        self.package_version = self.d["package_version"]
-        package_version_parsed = Version(self.d["package_version"])
+        self.package_version = self.d.get("package_version", "")
+        try:
+            package_version_parsed = Version(self.package_version)
+        except InvalidVersion as e:
+            # an empty version is already reported as a missing value
+            if self.package_version:
+                self.config_error(f"package-config.ini: {e}")
+            package_version_parsed = Version("0")
         self.d["package_version_major"] = package_version_parsed.major
         self.d["package_version_minor"] = package_version_parsed.minor
         self.d["package_version_patch"] = package_version_parsed.micro
 
+        # incremental builds keep the build directory and only rewrite changed outputs
+        self.incremental = self.d.get("incremental", "0") != "0"
+        self.template_fingerprints = {}
+        # the templates are read from the template directory the first time they are needed
+        self.template_directory = "PACKAGE_TEMPLATE"
+        self.templates = None
+        self.rendered_outputs = set()
+        # created the first time anything is downloaded
+        self.http = None
+        # set by read_package_index
+        self.existing_index = None
+        # when resuming, the build directory is kept and finished work is skipped
+        self.resume = False
+        self.checkpoint = None
+        # names of the boards to build, set by select_boards; None builds all of them
+        self.selected_boards = None
+        # the GCC toolchain, found the first time it is needed
+        self.toolchain = None
+        # the package files when the package is only built in memory
+        self.package_tree = None
+        # set to keep the uf2 repo checkout after the build, to be reused by the next one
+        self.keep_uf2_checkout = False
+        # set once the latest uf2 release tag has been looked up
+        self.uf2_release_checked = False
+        self.config_cache = config_cache
+
+        # timing of each build stage; PROFILE_STAGE runs that stage under cProfile
+        self.profiler = BuildProfiler(
+            self.d.get("profile_stage"),
+            os.path.join(os.path.dirname(self.config_directory), "build"),
+        )
+
         # read all board configuration data
         print("Reading board configs...")
-        self.read_board_configs()
+        with self.profiler.stage("read_board_configs"):
+            self.read_board_configs()
 
+    # reports every empty value before raising an error
     def check_missing_values(self, dictionary):
-        for key, value in dictionary.items():
-            if not value:
-                print(f"No value provided for {key}")
-                raise RuntimeError("Missing configuration parameters")
+        missing = [key for key, value in dictionary.items() if not value]
+        for key in missing:
+            print(f"No value provided for {key}")
+        if missing:
+            raise RuntimeError(
+                f"Missing configuration parameters: {', '.join(missing)}"
+            )
 
+    # stops with the error, or when checking the config, saves it for preflight_check
+    def config_error(self, error):
+        if not self.check:
+            raise RuntimeError(error)
+        self.config_errors.append(error)
+
+    # directory for everything kept between builds, outside of the build directory
+    # which is deleted at the start of each build
+    def cache_directory(self):
+        if "cache_directory" in self.d:
+            return self.d["cache_directory"]
+        return os.path.join(os.path.dirname(self.config_directory), ".build_cache")
+
+    # reads every board config in the config directory
+    # The boards are read CONFIG_JOBS at a time and boards whose config file hasn't changed
+    # since an earlier build are loaded from the board config cache (set CONFIG_CACHE = 0 to
+    # always parse them).
     def read_board_configs(self):
-        for board_dir in os.listdir(self.config_directory):
+        board_dirs = []
+        for board_dir in sorted(os.listdir(self.config_directory)):
             if (
                 not os.path.isdir(os.path.join(self.config_directory, board_dir))
                 or "your-variant" in board_dir
@@ -401,56 +1705,291 @@ class SAMDPackage:
             )
             print(f"Looking for board config at {board_config_path}")
             if os.path.isfile(board_config_path) and "EXAMPLE" not in board_config_path:
-                print(f"Reading config for board {board_dir}")
-                board_config = SAMDBoard(board_config_path)
-                board_config.d["board_dir"] = os.path.join(
-                    self.config_directory, board_dir
-                )
-                # add flag for the board name
-                board_config.d[
-                    "extra_flags"
-                ] += f" -D{self.d['vendor_name'].upper()}_{board_config.d['board_name_upper']}"
-                board_config.d["extra_flags_pio"] = board_config.d["extra_flags"].split(
-                    " "
-                )
-                # remove the duplicate flags added by default by PlatformIO
-                board_config.d["extra_flags_pio"] = [
-                    flag
-                    for flag in board_config.d["extra_flags_pio"]
-                    if flag not in ["-mfloat-abi=hard", "-mfpu=fpv4-sp-d16"]
-                ]
-                if board_config.is_samd51:
-                    # enable the cache
-                    # this is done in a special cache flag for the Arduino IDE, but in the build flags for PlatformIO
-                    board_config.d["extra_flags_pio"].append("-DENABLE_CACHE")
-                # convert to json-esque string
-                board_config.d["extra_flags_pio"] = json.dumps(
-                    board_config.d["extra_flags_pio"]
-                )
-                self.boards_config.append(board_config)
+                board_dirs.append(board_dir)
             else:
                 print(f"No config file found for board {board_dir}, skipping.")
 
-    # reads template file, does all substitutions from the dictionary, saves result as destination
-    # source and destination should be filenames
-    def process_file(self, source, destination, sub_dict=None):
-        print(f"Processing template file {source} to create {destination}")
-        if sub_dict is None:
-            sub_dict = self.d
+        config_cache = self.config_cache
+        if config_cache is None and self.d.get("config_cache", "1") != "0":
+            config_cache = BoardConfigCache(
+                os.path.join(self.cache_directory(), "board_configs")
+            )
+            self.config_cache = config_cache
+        jobs = int(self.d.get("config_jobs", os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            boards = list(
+                pool.map(
+                    functools.partial(self.read_board_config, config_cache), board_dirs
+                )
+            )
+        self.boards_config += [board for board in boards if board is not None]
+        if config_cache is not None:
+            print(
+                f"Board config cache: {config_cache.hits} hits, {config_cache.misses} misses"
+            )
+            config_cache.prune()
 
-        # open the template file
-        with open(source, "r", encoding="UTF-8") as template_file:
-            original = template_file.read()
+    # reads the config of one board, from the cache if it's there
+    # in check mode, returns None if the config can't be read
+    def read_board_config(self, config_cache, board_dir):
+        board_config_path = os.path.join(
+            self.config_directory, board_dir, "board-config.ini"
+        )
+        print(f"Reading config for board {board_dir}")
+        try:
+            key = state = None
+            if config_cache is not None:
+                key = config_cache.make_key(board_config_path)
+                state = config_cache.load(key)
+            if state is not None:
+                board_config = SAMDBoard.from_state(state)
+            else:
+                board_config = SAMDBoard(board_config_path)
+                if config_cache is not None:
+                    config_cache.store(key, board_config.state())
+        except Exception as e:
+            if not self.check:
+                raise
+            self.config_errors.append(f"{board_config_path}: {e!r}")
+            return None
+        board_config.d["board_dir"] = os.path.join(self.config_directory, board_dir)
+        # add flag for the board name
+        board_config.d[
+            "extra_flags"
+        ] += f" -D{self.d.get('vendor_name', '').upper()}_{board_config.d['board_name_upper']}"
+        board_config.d["extra_flags_pio"] = board_config.d["extra_flags"].split(" ")
+        # remove the duplicate flags added by default by PlatformIO
+        board_config.d["extra_flags_pio"] = [
+            flag
+            for flag in board_config.d["extra_flags_pio"]
+            if flag not in ["-mfloat-abi=hard", "-mfpu=fpv4-sp-d16"]
+        ]
+        if board_config.is_samd51:
+            # enable the cache
+            # this is done in a special cache flag for the Arduino IDE, but in the build flags for PlatformIO
+            board_config.d["extra_flags_pio"].append("-DENABLE_CACHE")
+        # convert to json-esque string
+        board_config.d["extra_flags_pio"] = json.dumps(
+            board_config.d["extra_flags_pio"]
+        )
+        return board_config
+
+    # picks the boards to build; every other board is reused from the previous build
+    # Boards can be picked by name, by chip family and by whether they changed since a git
+    # ref ("changed_since") or since the previous build ("changed_since_manifest"); when more
+    # than one is given, only boards that match all of them are built.
+    def select_boards(
+        self,
+        names=None,
+        chip_families=None,
+        changed_since=None,
+        changed_since_manifest=False,
+    ):
+        selected = {board.name for board in self.boards_config}
+        if names:
+            unknown = set(names) - selected
+            if unknown:
+                raise RuntimeError(f"Unknown boards: {', '.join(sorted(unknown))}")
+            selected &= set(names)
+        if chip_families:
+            families = {family.upper() for family in chip_families}
+            selected &= {
+                board.name
+                for board in self.boards_config
+                if board.chip_family.upper() in families
+            }
+        if changed_since:
+            selected &= self.boards_changed_since(changed_since)
+        if changed_since_manifest:
+            selected &= self.boards_changed_since_manifest()
+        self.selected_boards = selected
+        print(
+            f"Building {len(selected)} of {len(self.boards_config)} boards: {', '.join(sorted(selected))}"
+        )
 
-        # make substitutions
-        new_data = Template(original).substitute(sub_dict)
+    # the boards whose bootloaders and board files are built in this run
+    def build_boards(self):
+        return [board for board in self.boards_config if self.is_built(board)]
+
+    def is_built(self, board):
+        return self.selected_boards is None or board.name in self.selected_boards
+
+    # names of the boards with files changed since the git ref, including uncommitted changes
+    # a change to the templates, or to the package config settings the package is made from,
+    # affects every board
+    def boards_changed_since(self, ref):
+        result = subprocess.run(
+            [
+                "git",
+                "diff",
+                "--name-only",
+                "--relative",
+                ref,
+                "--",
+                self.config_directory,
+                self.template_directory,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise RuntimeError(
+                f"Could not list the files changed since {ref}: {result.stderr.strip()}"
+            )
+        changed = set()
+        config_file_name = os.path.abspath(
+            os.path.join(self.config_directory, "package-config.ini")
+        )
+        for file_name in result.stdout.splitlines():
+            if os.path.abspath(file_name) == config_file_name:
+                previous_config = subprocess.run(
+                    ["git", "show", f"{ref}:./{file_name}"],
+                    capture_output=True,
+                    text=True,
+                )
+                with open(file_name, "r", encoding="UTF-8") as config_file:
+                    if not previous_config.returncode and self.package_config_outputs(
+                        previous_config.stdout
+                    ) == self.package_config_outputs(config_file.read()):
+                        print(f"Only build settings changed in {file_name} since {ref}")
+                        continue
+            file_name = os.path.abspath(file_name)
+            for board in self.boards_config:
+                if file_name.startswith(os.path.abspath(board.d["board_dir"]) + os.sep):
+                    changed.add(board.name)
+                    break
+            else:
+                print(f"{file_name} changed since {ref}, so every board is affected")
+                return {board.name for board in self.boards_config}
+        return changed
 
-        # write the new file
-        with open(destination, "w", encoding="UTF-8") as dest_file:
-            dest_file.write(new_data)
+    def board_manifest_file(self):
+        return os.path.join(
+            os.path.dirname(self.config_directory), "build", "board_manifest.json"
+        )
+
+    # the package config values in the config text that the package files are made from
+    # the other [build] settings only change how the build runs, and any empty one is unset
+    def package_config_outputs(self, config_text):
+        config_file = configparser.ConfigParser()
+        config_file.read_string(config_text)
+        return {
+            section: {
+                key: value
+                for key, value in config_file[section].items()
+                if section != "build" or (key in self.output_build_settings and value)
+            }
+            for section in config_file.sections()
+        }
+
+    # a hash of everything a board's files are made from, for each board
+    # the bootloaders are built from the uf2 release, so its tag is looked up if it isn't
+    # known yet
+    def board_input_hashes(self):
+        if "uf2_version_tag" not in self.d:
+            self.check_uf2_version()
+        with open(
+            os.path.join(self.config_directory, "package-config.ini"),
+            "r",
+            encoding="UTF-8",
+        ) as config_file:
+            config_outputs = self.package_config_outputs(config_file.read())
+        package_hash = BootloaderCache.make_key(
+            json.dumps(config_outputs, sort_keys=True),
+            tree_sha256(self.template_directory),
+            self.d["uf2_version_tag"],
+        )
+        return {
+            board.name: BootloaderCache.make_key(
+                package_hash, tree_sha256(board.d["board_dir"])
+            )
+            for board in self.boards_config
+        }
+
+    # names of the boards whose inputs changed since the last build saved its manifest
+    def boards_changed_since_manifest(self):
+        if not os.path.isfile(self.board_manifest_file()):
+            print("There is no manifest of a previous build, so every board is built")
+            return {board.name for board in self.boards_config}
+        with open(self.board_manifest_file(), "r", encoding="UTF-8") as manifest_file:
+            previous_hashes = json.load(manifest_file)["boards"]
+        return {
+            name
+            for name, input_hash in self.board_input_hashes().items()
+            if previous_hashes.get(name) != input_hash
+        }
+
+    # saves the input hashes of the boards built by this run, for a later build of only the
+    # boards that changed; boards that were not built keep the hashes they were built from
+    def write_board_manifest(self):
+        board_hashes = {}
+        if os.path.isfile(self.board_manifest_file()):
+            with open(
+                self.board_manifest_file(), "r", encoding="UTF-8"
+            ) as manifest_file:
+                board_hashes = json.load(manifest_file)["boards"]
+        built = {board.name for board in self.build_boards()}
+        for name, input_hash in self.board_input_hashes().items():
+            if name in built:
+                board_hashes[name] = input_hash
+        write_if_changed(
+            self.board_manifest_file(),
+            json.dumps({"boards": board_hashes}, indent=2, sort_keys=True),
+        )
+
+    # boards that were not selected can only be reused if the previous build made them,
+    # so any board without its variant files or this version's bootloader is built anyway
+    def check_previous_board_outputs(self):
+        if self.selected_boards is None:
+            return
+        if self.package_tree is not None:
+            print("The package is built in memory, so every board is built")
+            self.selected_boards = {board.name for board in self.boards_config}
+            return
+        for board in self.boards_config:
+            if board.name in self.selected_boards:
+                continue
+            if not os.path.isdir(
+                os.path.join(self.package_directory, "variants", board.name)
+            ) or not os.path.isfile(
+                os.path.join(
+                    self.package_directory,
+                    "bootloaders",
+                    board.name,
+                    board.d["bootloader_filename"],
+                )
+            ):
+                print(f"No previous build of {board.name} to reuse, building it too")
+                self.selected_boards.add(board.name)
+
+    # renders the named package template with the substitutions from the dictionary and saves
+    # the result as destination
+    # In an incremental build the template text and the values of the placeholders it uses
+    # are fingerprinted, and a destination with an unchanged fingerprint is not rewritten.
+    def process_file(self, template_name, destination, sub_dict=None):
+        if sub_dict is None:
+            sub_dict = self.d
 
-        # delete the template file
-        os.remove(source)
+        self.rendered_outputs.add(destination)
+        if self.package_tree is not None:
+            self.package_tree.add_text(
+                destination, self.templates.render(template_name, sub_dict)
+            )
+            return
+        fingerprint = self.templates.fingerprint(template_name, sub_dict)
+        if (
+            self.incremental
+            and self.template_fingerprints.get(destination) == fingerprint
+            and os.path.isfile(destination)
+        ):
+            print(f"Template output {destination} is up to date")
+            return
+        print(f"Processing template file {template_name} to create {destination}")
+        # make substitutions and write the new file
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, "w", encoding="UTF-8") as dest_file:
+            dest_file.write(self.templates.render(template_name, sub_dict))
+        self.template_fingerprints[destination] = fingerprint
 
     def setup_build_directory(self):
         # directory for the built package
@@ -459,41 +1998,76 @@ class SAMDPackage:
         )
         self.package_directory = os.path.join(self.build_directory, "current")
         print(f"Setting up build directory at {self.package_directory}")
-        # remove old build directory, if it exists
-        print("Checking for and deleting the content of existing stale build directory")
-        if os.path.exists(self.build_directory):
+        self.template_fingerprints_file = os.path.join(
+            self.build_directory, "template_fingerprints.json"
+        )
+        # the existing build directory is kept and brought up to date unless a clean build
+        # is asked for; only the uf2 repo is cloned fresh every time
+        # when resuming a build, the uf2 repo and its built bootloaders are kept as well, and
+        # a kept uf2 checkout is checked by clone_uf2_repo
+        start = time.perf_counter()
+        if self.resume:
+            print("Resuming the previous build")
+        elif self.d.get("clean_build", "0") != "0" and os.path.exists(
+            self.build_directory
+        ):
             print("Removing old build directory")
             shutil.rmtree(self.build_directory, onexc=remove_readonly)
+        elif not self.keep_uf2_checkout and os.path.exists(
+            f"{self.build_directory}/uf2-samdx1"
+        ):
+            print("Removing the old clone of the uf2 repo")
+            shutil.rmtree(f"{self.build_directory}/uf2-samdx1", onexc=remove_readonly)
+        if self.incremental and os.path.isfile(self.template_fingerprints_file):
+            with open(
+                self.template_fingerprints_file, "r", encoding="UTF-8"
+            ) as fingerprints_file:
+                self.template_fingerprints = json.load(fingerprints_file)
+        # with PACKAGE_IN_MEMORY the package files are never written to build/current;
+        # they are streamed straight from their sources into the package archive
+        if self.d.get("package_in_memory", "0") != "0":
+            self.package_tree = PackageTree(self.package_directory)
+        else:
+            os.makedirs(self.package_directory, exist_ok=True)
+        for board in self.boards_config:
+            self.set_bootloader_names(board)
+        self.check_previous_board_outputs()
+        self.checkpoint = BuildCheckpoint(
+            os.path.join(self.build_directory, "checkpoint.json"), self.resume
+        )
+        clean_time = time.perf_counter() - start
 
-        # copy the template directory into the build directory
-        print("Copying the template directory")
-        shutil.copytree("PACKAGE_TEMPLATE", self.package_directory)
-
-        # select which fuse setting script to keep
-        fuses_dir = self.package_directory + "/scripts/fuses"
+        # collect everything to copy into the build directory
+        # the templates themselves are rendered straight into the build directory later
+        start = time.perf_counter()
+        self.tree_sync = TreeSync(
+            int(self.d.get("copy_jobs", 8)), self.d.get("link_files", "0") != "0"
+        )
+        print("Collecting the template directory")
+        self.tree_sync.add_tree(
+            self.template_directory, self.package_directory, ignore_templates
+        )
 
-        # delete irrelevant the fuse-setting scripts
-        fuse_src_files = [
-            os.path.join(dp, f)
-            for dp, dn, filenames in os.walk(fuses_dir)
-            for f in filenames
-        ]
-        for file_name in fuse_src_files:
-            if os.path.isfile(file_name) and any(
+        # leave out the fuse-setting scripts for chips that aren't used
+        fuses_dir = os.path.normpath(self.package_directory + "/scripts/fuses")
+        for file_name in list(self.tree_sync.files):
+            if file_name.startswith(fuses_dir + os.sep) and any(
                 chip not in file_name
                 for chip in [board.chip_family.lower() for board in self.boards_config]
             ):
-                os.remove(file_name)
+                del self.tree_sync.files[file_name]
 
         # copy the variants directories
         variants_dir = os.path.join(self.package_directory, "variants")
         for board in self.boards_config:
+            if not self.is_built(board):
+                continue
             print(f"Duplicating the board template directory for board {board.name}")
             dest_board_variant = os.path.join(variants_dir, board.name)
-            shutil.copytree(
-                os.path.join(variants_dir, "variant_template"),
+            self.tree_sync.add_tree(
+                os.path.join(self.template_directory, "variants", "variant_template"),
                 dest_board_variant,
-                dirs_exist_ok=True,
+                ignore_templates,
             )
             print(
                 f"Copying variant files for board {board.name} from {board.d['board_dir']} into build directory at {dest_board_variant}"
@@ -503,248 +2077,1121 @@ class SAMDPackage:
                 os.path.join(board.d["board_dir"], "variant.h")
             ) and os.path.isfile(os.path.join(board.d["board_dir"], "variant.cpp")):
                 # move the hand written variants files into the board variant directory
-                shutil.copy2(
+                self.tree_sync.add_file(
                     os.path.join(board.d["board_dir"], "variant.cpp"),
-                    dest_board_variant,
+                    os.path.join(dest_board_variant, "variant.cpp"),
                 )
-                shutil.copy2(
-                    os.path.join(board.d["board_dir"], "variant.h"), dest_board_variant
+                self.tree_sync.add_file(
+                    os.path.join(board.d["board_dir"], "variant.h"),
+                    os.path.join(dest_board_variant, "variant.h"),
                 )
             else:
                 print(
                     f"No variant.h or variant.cpp file found for board {board.name} in {board.d['board_dir']}, skipping copying of these files."
                 )
+        collect_time = time.perf_counter() - start
 
-            # Add filenames to the dictionary
-            board.d["bootloader_dir"] = (
-                f"{self.build_directory}/uf2-samdx1/build/{board.name}"
-            )
-            board.d["bootloader_build_name"] = (
-                f"bootloader-{board.name}-{self.d['uf2_version_tag']}"
+        if self.package_tree is not None:
+            for dest, src in self.tree_sync.files.items():
+                self.package_tree.add_file(src, dest)
+            print(
+                f"Build directory setup: clean {clean_time:.3f}s, collect {collect_time:.3f}s, {len(self.tree_sync.files)} files kept in memory"
             )
-            board.d["bootloader_versioned_name"] = (
-                f"bootloader-{board.name}-{board.board_version}-uf2{self.d['uf2_version_tag']}"
+            return
+        self.tree_sync.run()
+        print(
+            f"Build directory setup: clean {clean_time:.3f}s, collect {collect_time:.3f}s, copy {self.tree_sync.timings['copy']:.3f}s"
+        )
+
+    # adds the names of the board's bootloader files to its dictionary
+    def set_bootloader_names(self, board):
+        board.d["bootloader_dir"] = (
+            f"{self.build_directory}/uf2-samdx1/build/{board.name}"
+        )
+        board.d["bootloader_build_name"] = (
+            f"bootloader-{board.name}-{self.d['uf2_version_tag']}"
+        )
+        board.d["bootloader_versioned_name"] = (
+            f"bootloader-{board.name}-{board.board_version}-uf2{self.d['uf2_version_tag']}"
+        )
+        board.d["bootloader_filename"] = f"{board.d['bootloader_versioned_name']}.bin"
+        print(
+            f"Compiled bootloader for board {board.name} will be saved to {board.d['bootloader_dir']}/{board.d['bootloader_filename']}"
+        )
+
+    # the stages of a full package build, in order, as
+    # (name, description, function, names of the stages it depends on)
+    def build_stages(self):
+        return [
+            (
+                "check_config",
+                "Checking the package configuration",
+                self.check_config,
+                [],
+            ),
+            (
+                "check_uf2_version",
+                "Checking for the latest version of the Adafruit UF-2 Repo",
+                self.check_uf2_version,
+                [],
+            ),
+            (
+                "read_package_index",
+                "Reading the existing package index",
+                self.read_package_index,
+                [],
+            ),
+            (
+                "setup_build_directory",
+                "Copying sources to build directory...",
+                self.setup_build_directory,
+                ["check_config", "check_uf2_version"],
+            ),
+            (
+                "write_platform_templates",
+                "Customizing all template files",
+                self.write_platform_templates,
+                ["setup_build_directory"],
+            ),
+            (
+                "clone_uf2_repo",
+                "Cloning the current Adafruit UF2 repo",
+                self.clone_uf2_repo,
+                ["setup_build_directory"],
+            ),
+            (
+                "write_bootloader_configs",
+                "Creating config files for the board bootloaders",
+                self.write_bootloader_configs,
+                ["clone_uf2_repo"],
+            ),
+            (
+                "build_bootloaders",
+                "Building bootloader...",
+                self.build_bootloaders,
+                ["write_bootloader_configs"],
+            ),
+            (
+                "copy_bootloaders",
+                "Copying the built bootloaders into the package",
+                self.copy_bootloaders,
+                ["build_bootloaders", "write_platform_templates"],
+            ),
+            (
+                "package_archive",
+                "Compressing the package archive",
+                self.package_archive,
+                ["copy_bootloaders"],
+            ),
+            (
+                "write_index_json",
+                "Creating json index file",
+                self.write_index_json,
+                ["package_archive", "read_package_index"],
+            ),
+            (
+                "clean_build_directory",
+                "Cleaning cloned and copied files from the build directory",
+                self.clean_build_directory,
+                ["write_index_json"],
+            ),
+        ]
+
+    # the build stages as a graph, so that stages that do not depend on each other, like
+    # the network requests and the template rendering, can run at the same time
+    # runs the whole build, each stage as soon as the stages it needs are done, then saves
+    # the board manifest and the timing report; returns the task graph that was run
+    def run_build(self):
+        def run_stage(stage_name, description, stage_function):
+            print(f"\n{description}")
+            with self.profiler.stage(stage_name):
+                stage_function()
+
+        graph = self.build_graph()
+        graph.run(int(self.d.get("pipeline_jobs", 4)), run_stage)
+        self.write_board_manifest()
+
+        # save the timing of each stage
+        print("\n" + self.profiler.summary())
+        print(graph.critical_path_summary())
+        self.profiler.write_report(
+            os.path.join(self.build_directory, "build_report.json"),
+            graph.critical_path(),
+        )
+        return graph
+
+    def build_graph(self):
+        graph = TaskGraph()
+        for name, description, function, dependencies in self.build_stages():
+            graph.add(
+                name,
+                functools.partial(self.run_checkpointed, name, function),
+                dependencies,
+                description,
             )
-            board.d["bootloader_filename"] = (
-                f"{board.d['bootloader_versioned_name']}.bin"
+        return graph
+
+    # the stages that are skipped when resuming a build if they are already done, as
+    # name -> (function returning the key of the stage's inputs,
+    #          function returning the files the stage makes,
+    #          names of the package values the stage sets)
+    # every other stage is quick to run again; bootloaders are checkpointed board by board
+    def checkpoint_stages(self):
+        return {
+            # the checkout's files are changed by the build (e.g. the Makefile on Windows),
+            # so only the commit it is at is checked
+            "clone_uf2_repo": (
+                lambda: (
+                    None
+                    if self.uf2_checkout_commit() is None
+                    else BootloaderCache.make_key(
+                        self.uf2_checkout_commit(), self.d.get("uf2_repo_url", "")
+                    )
+                ),
+                lambda: [],
+                [],
+            ),
+            "package_archive": (
+                lambda: (
+                    self.package_tree.sha256()
+                    if self.package_tree is not None
+                    else tree_sha256(self.package_directory)
+                ),
+                lambda: [
+                    os.path.join(self.build_directory, self.d["archive_filename"])
+                ],
+                ["archive_filename", "archive_size", "archive_checksum"],
+            ),
+        }
+
+    # runs a build stage, or skips it if resuming and the checkpoint shows it is done
+    # a stage whose key is None has nothing to check yet, so it always runs and is only
+    # recorded if it has a key once it is done
+    def run_checkpointed(self, name, function):
+        if name not in self.checkpoint_stages() or self.checkpoint is None:
+            return function()
+        make_key, stage_files, value_names = self.checkpoint_stages()[name]
+        key = make_key()
+        if key is not None and self.checkpoint.done(f"stage/{name}", key):
+            print(f"Skipping {name}, it was already done for the same inputs")
+            self.d.update(self.checkpoint.values(f"stage/{name}"))
+            return
+        self.checkpoint.forget(f"stage/{name}")
+        function()
+        key = make_key()
+        files = stage_files()
+        if key is not None and all(os.path.isfile(filename) for filename in files):
+            self.checkpoint.record(
+                f"stage/{name}",
+                key,
+                files,
+                {value_name: self.d[value_name] for value_name in value_names},
             )
+
+    # writes the board.mk and board_config.h files for each board into the uf2 repo
+    def write_bootloader_configs(self):
+        for board in self.build_boards():
+            with self.profiler.board(board.name):
+                bootloader_config_dir = (
+                    f"{self.build_directory}/uf2-samdx1/boards/{board.d['board_name']}"
+                )
+                os.makedirs(bootloader_config_dir, exist_ok=True)
+                board.write_board_mk(bootloader_config_dir)
+                board.write_board_config(bootloader_config_dir, self.d)
+
+    # copies the built bootloaders into the package, renamed with the board version
+    def copy_bootloaders(self):
+        for board in self.build_boards():
+            with self.profiler.board(board.name):
+                self.copy_board_bootloader(board)
+
+    def copy_board_bootloader(self, board):
+        bootloader_dest = f"{self.package_directory}/bootloaders/{board.name}"
+        if self.package_tree is not None:
+            self.package_tree.add_directory(bootloader_dest)
+            for file_name, new_filename in self.bootloader_files(board):
+                self.package_tree.add_file(
+                    os.path.join(board.d["bootloader_dir"], file_name),
+                    os.path.join(bootloader_dest, new_filename),
+                )
+            return
+        # bootloaders from an earlier build, e.g. of another board version or UF2 tag, must
+        # not stay in the package
+        if os.path.exists(bootloader_dest):
+            shutil.rmtree(bootloader_dest, onexc=remove_readonly)
+        os.makedirs(bootloader_dest)
+
+        # copy all of the built files into the bootloader directory
+        for file_name, new_filename in self.bootloader_files(board):
+            full_file_name = os.path.join(board.d["bootloader_dir"], file_name)
+            print(f"Copying from {full_file_name} to {full_file_name}")
+            shutil.copy(full_file_name, bootloader_dest)
+            # rename from the UF2 version set by make to the configured version
             print(
-                f"Compiled bootloader for board {board.name} will be saved to {board.d['bootloader_dir']}/{board.d['bootloader_filename']}"
+                f"Renaming from {os.path.join(bootloader_dest, file_name)} to {os.path.join(bootloader_dest, new_filename)}"
+            )
+            os.replace(
+                f"{os.path.join(bootloader_dest, file_name)}",
+                f"{os.path.join(bootloader_dest, new_filename)}",
             )
 
-        # delete the variant template directory after copying the files we need from it
-        print("Deleting the raw board template directory")
-        shutil.rmtree(
-            os.path.join(variants_dir, "variant_template"), onexc=remove_readonly
-        )
-
-    def build_bootloaders(self):
+    # the built bootloader files of the board that go into the package, as
+    # (file name, file name in the package with the board version)
+    def bootloader_files(self, board):
+        bootloader_files = []
+        for file_name in bootloader_file_names(
+            board.d["bootloader_dir"], board.d["bootloader_build_name"]
+        ):
+            new_filename = (
+                file_name.replace(
+                    board.d["bootloader_build_name"],
+                    board.d["bootloader_versioned_name"],
+                )
+                .replace(
+                    f"{board.d['bootloader_versioned_name']}dirty",
+                    board.d["bootloader_versioned_name"],
+                )
+                .replace(
+                    f"{board.d['bootloader_versioned_name']}+",
+                    board.d["bootloader_versioned_name"],
+                )
+            )
+            bootloader_files.append((file_name, new_filename))
+        return bootloader_files
+
+    # builds the bootloaders for all boards
+    # jobs is the number of boards built at once and make_jobs is passed to each make as -j;
+    # if not given, they are taken from the [build] section of the package config
+    # with fail_fast, the first failure stops the other builds; either way the build ends
+    # with an error naming the failed boards once all of the builds are done
+    # returns a dictionary of board name -> True for a successful build, or "cached"
+    # if the bootloader was restored from the bootloader cache instead of being built
+    def build_bootloaders(self, jobs=None, make_jobs=None, fail_fast=None):
         # first, get paths
         new_env = self.get_paths()
-        os.chdir("build/uf2-samdx1")
+        uf2_directory = os.path.abspath(f"{self.build_directory}/uf2-samdx1")
         if self.d["build_os"].lower() == "windows":
-            self.update_make_for_windows()
-        # run make to build bootloader
-        for board in self.boards_config:
-            board.build_bootloader(new_env)
+            self.update_make_for_windows(uf2_directory)
+        if jobs is None:
+            jobs = int(self.d.get("build_jobs", 1))
+        if make_jobs is None:
+            make_jobs = int(self.d.get("make_jobs", 1))
+        if fail_fast is None:
+            fail_fast = self.d.get("fail_fast", "0") != "0"
+        monitor = BuildMonitor(self.d.get("build_output", "errors"), fail_fast)
+        compiler_launcher = self.compiler_cache(new_env)
+
+        # when resuming, skip the bootloaders that were already built by the failed build
+        build_results = {}
+        cache_keys = {}
+        boards_to_build = []
+        for board in self.build_boards():
+            if self.checkpoint.done(
+                f"bootloader/{board.name}", self.bootloader_key(board)
+            ):
+                print(f"Bootloader for {board.name} is already built")
+                build_results[board.name] = "resumed"
+            else:
+                boards_to_build.append(board)
+
+        # check the cache for bootloaders that have already been built
+        if self.d.get("bootloader_cache", "1") != "0":
+            cache = BootloaderCache(
+                os.path.join(self.cache_directory(), "bootloaders"),
+                int(self.d.get("bootloader_cache_size_mb", 200)) * 1024 * 1024,
+            )
+            uncached_boards = []
+            for board in boards_to_build:
+                cache_keys[board.name] = self.bootloader_key(board)
+                if cache.restore(cache_keys[board.name], board.d["bootloader_dir"]):
+                    print(f"Using cached bootloader for {board.name}")
+                    build_results[board.name] = "cached"
+                    self.checkpoint_bootloader(board)
+                else:
+                    uncached_boards.append(board)
+            boards_to_build = uncached_boards
+
+        # count the compiler cache hits of just this build
+        if compiler_launcher and boards_to_build:
+            subprocess.run(
+                [compiler_launcher, "--zero-stats"],
+                env=new_env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+        # run make to build bootloader, on the bootloader workers if there are any
+        workers = self.d.get("build_workers", "").split()
+        if workers and boards_to_build:
+            build_results.update(
+                self.build_remote_bootloaders(
+                    boards_to_build, workers, make_jobs, monitor
+                )
+            )
+            # boards no worker could build are built here
+            local_boards = [
+                board for board in boards_to_build if board.name not in build_results
+            ]
+        else:
+            local_boards = boards_to_build
+        if jobs > 1 and len(local_boards) > 1:
+            print(
+                f"Building {len(local_boards)} bootloaders, {jobs} at a time, with make -j{make_jobs}"
+            )
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        self.build_board_bootloader,
+                        board,
+                        new_env,
+                        uf2_directory,
+                        make_jobs,
+                        True,
+                        monitor,
+                        compiler_launcher,
+                    ): board
+                    for board in local_boards
+                }
+                for future in as_completed(futures):
+                    board = futures[future]
+                    try:
+                        build_results[board.name] = future.result()
+                    except Exception as e:
+                        print(f"Building bootloader for {board.name} raised {e!r}")
+                        build_results[board.name] = False
+        else:
+            for board in local_boards:
+                build_results[board.name] = self.build_board_bootloader(
+                    board,
+                    new_env,
+                    uf2_directory,
+                    make_jobs,
+                    False,
+                    monitor,
+                    compiler_launcher,
+                )
+
+        # save the newly built bootloaders to the cache
+        if cache_keys:
+            for board in boards_to_build:
+                if build_results[board.name]:
+                    cache.store(
+                        cache_keys[board.name],
+                        board.d["bootloader_dir"],
+                        bootloader_file_names(
+                            board.d["bootloader_dir"], board.d["bootloader_build_name"]
+                        ),
+                    )
+
+        # print a summary of all of the builds
+        print("\nBootloader build summary:")
+        for board in self.build_boards():
+            if build_results[board.name] in ["cached", "resumed"]:
+                status = f"passed ({build_results[board.name]})"
+            elif board.name in monitor.stopped:
+                status = "stopped"
+            else:
+                status = "passed" if build_results[board.name] else "FAILED"
+            if board.name in monitor.durations:
+                status += f" in {monitor.durations[board.name]:.1f}s"
+            if board.name in monitor.errors and board.name not in monitor.stopped:
+                status += f"\n    {monitor.errors[board.name]}"
+            print(f"  {board.name.ljust(30)} {status}")
+        if cache_keys:
+            print(cache.stats())
+        if compiler_launcher and boards_to_build:
+            print(self.compiler_cache_stats(compiler_launcher, new_env))
+        failed = sorted(name for name, result in build_results.items() if not result)
+        if failed:
+            print(
+                f"{len(failed)} of {len(build_results)} bootloaders failed to build; see the build logs in {self.build_directory}"
+            )
+            raise RuntimeError(
+                f"Building the bootloaders failed for: {', '.join(failed)}"
+            )
+        return build_results
+
+    # builds the bootloader for one board, recording the time it takes
+    # the build is skipped if another board has already failed in fail-fast mode
+    def build_board_bootloader(
+        self,
+        board,
+        new_env,
+        uf2_directory,
+        make_jobs,
+        quiet,
+        monitor,
+        compiler_launcher=None,
+    ):
+        if monitor.cancelled.is_set():
+            monitor.skip(board.name)
+            return False
+        build_args = (
+            new_env,
+            uf2_directory,
+            make_jobs,
+            quiet,
+            monitor,
+            compiler_launcher,
+        )
+        self.checkpoint.forget(f"bootloader/{board.name}")
+        with self.profiler.board(board.name):
+            built = board.build_bootloader(*build_args)
+        if built:
+            self.checkpoint_bootloader(board)
+        return built
+
+    # builds the bootloaders on the bootloader workers, each worker taking the next board as
+    # soon as it is done with the last one
+    # A worker that can't be reached, times out or sends back files that don't match their
+    # hashes is dropped and its board is given to another worker, up to WORKER_RETRIES times.
+    # returns a dictionary of board name -> True/False for build success, without the boards
+    # that were left over when every worker was dropped
+    def build_remote_bootloaders(self, boards, workers, make_jobs, monitor):
+        retries = int(self.d.get("worker_retries", 2))
+        print(f"Building {len(boards)} bootloaders on {len(workers)} workers")
+        pending = deque(boards)
+        attempts = {}
+        results = {}
+        lock = threading.Lock()
+        session = requests.Session()
+
+        def run_worker(worker):
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    board = pending.popleft()
+                if monitor.cancelled.is_set():
+                    monitor.skip(board.name)
+                    results[board.name] = False
+                    continue
+                try:
+                    results[board.name] = self.build_remote_bootloader(
+                        session, worker, board, make_jobs, monitor
+                    )
+                except (
+                    requests.RequestException,
+                    KeyError,
+                    ValueError,
+                    RuntimeError,
+                ) as e:
+                    print(f"Lost bootloader worker {worker} building {board.name}: {e}")
+                    with lock:
+                        attempts[board.name] = attempts.get(board.name, 0) + 1
+                        if attempts[board.name] > retries:
+                            results[board.name] = False
+                        else:
+                            pending.append(board)
+                    return
+
+        with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+            for future in [
+                executor.submit(contextvars.copy_context().run, run_worker, worker)
+                for worker in workers
+            ]:
+                future.result()
+        if pending:
+            print(
+                f"No bootloader workers left; building the other {len(pending)} bootloaders here"
+            )
+        return results
+
+    # builds one board's bootloader on a worker and saves the files it sends back
+    # raises an error if the worker couldn't be used; returns False if make failed
+    def build_remote_bootloader(self, session, worker, board, make_jobs, monitor):
+        request = {
+            "board": board.name,
+            "board_version": board.board_version,
+            "uf2_version_tag": self.d["uf2_version_tag"],
+            "uf2_repo_url": self.d.get(
+                "uf2_repo_url", "https://github.com/adafruit/uf2-samdx1.git"
+            ),
+            "make_jobs": make_jobs,
+            "files": {
+                "board.mk": board.board_mk_contents(),
+                "board_config.h": board.board_config_contents(self.d),
+            },
+        }
+        self.checkpoint.forget(f"bootloader/{board.name}")
+        with self.profiler.board(board.name):
+            monitor.started(board.name, None)
+            url = worker if "://" in worker else f"http://{worker}"
+            response = session.post(
+                f"{url}/build",
+                json=request,
+                timeout=float(self.d.get("worker_timeout", 1800)),
+            )
+            response.raise_for_status()
+            result = response.json()
+            with open(
+                os.path.join(
+                    self.build_directory, f"{board.name}_bootloader_build_log.txt"
+                ),
+                "w",
+                encoding="UTF-8",
+            ) as logfile:
+                logfile.write(result["log"])
+            for line in result["log"].splitlines():
+                monitor.line(board.name, line)
+            monitor.finished(board.name, 0 if result["ok"] else 1)
+            if result["gcc_version"] != self.gcc_version:
+                print(
+                    f"Warning: {worker} built {board.name} with a different compiler, {result['gcc_version']}"
+                )
+            if not result["ok"]:
+                print(f"Making bootloader failed for {board.name} on {worker}")
+                return False
+
+            # check every file before saving any of them
+            files = {}
+            for file_name, entry in result["files"].items():
+                data = base64.b64decode(entry["data"])
+                if (
+                    os.path.basename(file_name) != file_name
+                    or hashlib.sha256(data).hexdigest() != entry["sha256"]
+                ):
+                    raise RuntimeError(f"{file_name} does not match its SHA256 hash")
+                files[file_name] = data
+            if not files:
+                raise RuntimeError("no bootloader files were sent back")
+            if os.path.exists(board.d["bootloader_dir"]):
+                shutil.rmtree(board.d["bootloader_dir"], onexc=remove_readonly)
+            os.makedirs(board.d["bootloader_dir"])
+            for file_name, data in files.items():
+                with open(
+                    os.path.join(board.d["bootloader_dir"], file_name), "wb"
+                ) as bootloader_file:
+                    bootloader_file.write(data)
+        print(f"Built bootloader for {board.name} on {worker}")
+        self.checkpoint_bootloader(board)
+        return True
+
+    # finds the compiler cache to put in front of arm-none-eabi-gcc and points it at a
+    # directory in the build cache, so objects are shared between boards and builds
+    # returns the path of the compiler cache program, or None to compile without one
+    def compiler_cache(self, new_env):
+        setting = self.d.get("compiler_cache", "auto")
+        if setting.lower() in ["0", "none"]:
+            return None
+        program = "ccache" if setting.lower() == "auto" else setting
+        launcher = shutil.which(program, path=new_env["PATH"])
+        if launcher is None:
+            if setting.lower() != "auto":
+                raise RuntimeError(f"Couldn't find the compiler cache {program}")
+            return None
+        print(f"Using the compiler cache {launcher}")
+        new_env["CCACHE_DIR"] = os.path.abspath(
+            os.path.join(self.cache_directory(), "ccache")
+        )
+        # paths inside the build directory are hashed relative to it and the working
+        # directory is left out, so every board's build directory shares the same objects
+        new_env["CCACHE_BASEDIR"] = os.path.abspath(self.build_directory)
+        new_env["CCACHE_NOHASHDIR"] = "1"
+        new_env["CCACHE_COMPILERCHECK"] = "content"
+        return launcher
+
+    # a summary of the compiler cache hits and misses since the statistics were zeroed
+    def compiler_cache_stats(self, launcher, new_env):
+        result = subprocess.run(
+            [launcher, "--print-stats"], env=new_env, capture_output=True, text=True
+        )
+        if result.returncode:
+            return "Compiler cache statistics are not available"
+        stats = dict(
+            line.split("\t", 1) for line in result.stdout.splitlines() if "\t" in line
+        )
+        hits = int(stats.get("direct_cache_hit", 0)) + int(
+            stats.get("preprocessed_cache_hit", 0)
+        )
+        misses = int(stats.get("cache_miss", 0))
+        hit_rate = 100 * hits / (hits + misses) if hits + misses else 0
+        return (
+            f"Compiler cache: {hits} hits, {misses} misses ({hit_rate:.0f}% hit rate)"
+        )
 
-        # move back to base directory
-        os.chdir("../..")
+    # the key of everything that goes into building a board's bootloader
+    def bootloader_key(self, board):
+        return BootloaderCache.make_key(
+            board.name,
+            board.board_version,
+            board.board_mk_contents(),
+            board.board_config_contents(self.d),
+            self.d["uf2_version_tag"],
+            self.gcc_version,
+            self.d["build_os"].lower(),
+        )
+
+    # records a board's built bootloader files in the checkpoint
+    def checkpoint_bootloader(self, board):
+        self.checkpoint.record(
+            f"bootloader/{board.name}",
+            self.bootloader_key(board),
+            [
+                os.path.join(board.d["bootloader_dir"], file_name)
+                for file_name in bootloader_file_names(
+                    board.d["bootloader_dir"], board.d["bootloader_build_name"]
+                )
+            ],
+        )
 
     # creates platform.txt, version and README.md files, by processing template files in package directory
     # these are used by the Arduino IDE
     def write_platform_templates(self):
-        # create template sub-directories for each board and copy the relevant template files into them
-        board_files_to_copy = [
-            {
-                "template_dir": os.path.join(self.package_directory, "boards"),
-                "src_file": "pio_board_TEMPLATE.json",
-            },
-            {"template_dir": self.package_directory, "src_file": "boards_TEMPLATE.txt"},
-            {
-                "template_dir": self.package_directory,
-                "src_file": "VARIANT_VERSION_TEMPLATE.h",
-            },
-            {
-                "template_dir": os.path.join(
-                    self.package_directory, "scripts", "jlink"
-                ),
-                "src_file": "debug_custom_TEMPLATE.json",
-            },
-            {
-                "template_dir": os.path.join(
-                    self.package_directory, "scripts", "openocd"
-                ),
-                "src_file": "daplink_samdx1_TEMPLATE.cfg",
-            },
-            {
-                "template_dir": os.path.join(
-                    self.package_directory, "scripts", "openocd"
-                ),
-                "src_file": "jlink_samdx1_TEMPLATE.cfg",
-            },
-        ]
+        board_templates, board_snippets, variant_templates, package_templates = (
+            self.template_groups()
+        )
+
+        # make sure every template has all of its values before writing anything
+        self.check_template_values(
+            board_templates + board_snippets, variant_templates, package_templates
+        )
+
+        board_entries = []
         for board in self.boards_config:
-            print(f"Customizing special template files for board {board.name}")
-            for file_info in board_files_to_copy:
-                dest_file = (
-                    file_info["src_file"]
-                    .replace("_TEMPLATE", "_" + board.name + "_TEMPLATE")
-                    .replace("pio_board", self.d["vendor_name"])
-                    # .replace("pio_board_", "")
-                )
-
-                # make a **copy** of the template
-                shutil.copy2(
-                    os.path.join(file_info["template_dir"], file_info["src_file"]),
-                    os.path.join(file_info["template_dir"], dest_file),
-                )
-                # process the template file
-                self.process_file(
-                    os.path.join(file_info["template_dir"], dest_file),
-                    os.path.join(
-                        file_info["template_dir"], dest_file.replace("_TEMPLATE", "")
-                    ),
-                    board.d | self.d,
+            with self.profiler.board(board.name):
+                board_entries.append(
+                    self.write_board_templates(
+                        board, board_templates, variant_templates
+                    )
                 )
 
-            # after processing the other templates, grab the variant version macros from the generated version file to insert into the pins_arduino.h file for the board
-            with open(
+        self.write_boards_txt(board_entries)
+
+        # Run substitutions in all remaining templates for the package
+        for template_name in package_templates:
+            self.process_file(
+                template_name,
                 os.path.join(
-                    self.package_directory, "VARIANT_VERSION_" + board.name + ".h"
+                    self.package_directory, template_name.replace("_TEMPLATE", "")
                 ),
-                "r",
-                encoding="UTF-8",
-            ) as version_file:
-                board.d["variant_version_macros"] = version_file.read()
-            os.remove(
-                os.path.join(
-                    self.package_directory, "VARIANT_VERSION_" + board.name + ".h"
-                )
             )
 
-            # Run substitutions in all remaining _TEMPLATE files in the variants directory
-            print(f"Customizing remaining template files for board {board.name}")
-            variant_dir = os.path.join(self.package_directory, "variants", board.name)
-            template_src_files = [
-                os.path.join(dp, f)
-                for dp, dn, filenames in os.walk(variant_dir)
-                for f in filenames
-                if "_TEMPLATE" in f
+        # there is nothing left over from earlier builds in a package built in memory
+        if self.package_tree is not None:
+            return
+
+        # anything else in the package directory is left over from an earlier build,
+        # except for the variants of boards that are reused from the previous build and the
+        # bootloaders of every board; copy_board_bootloader clears the bootloaders of the
+        # boards being built before it copies the new ones in
+        self.tree_sync.remove_stale(
+            self.package_directory,
+            keep=self.rendered_outputs
+            | {os.path.join(self.package_directory, "boards.txt")},
+            keep_prefixes=[
+                os.path.join(self.package_directory, "bootloaders", board.name)
+                for board in self.boards_config
             ]
-            for file_name in template_src_files:
-                if os.path.isfile(file_name):
-                    print(f"Processing template for {file_name}")
-                    self.process_file(
-                        file_name,
-                        file_name.replace("_TEMPLATE", ""),
-                        board.d | self.d,
-                    )
-
-        # delete the template files we made copies of instead of simply moving
-        print("Deleting template files that were copied for processing")
-        for file_info in board_files_to_copy:
-            os.remove(os.path.join(file_info["template_dir"], file_info["src_file"]))
+            + [
+                os.path.join(self.package_directory, "variants", board.name)
+                for board in self.boards_config
+                if not self.is_built(board)
+            ],
+        )
 
-        # combine the boards template files into a single file with all boards, and delete the individual board template files
-        print(
-            "Combining individual board template files into a single boards.txt file and deleting the individual files"
+        # remember what each output was rendered from for the next incremental build
+        write_if_changed(
+            self.template_fingerprints_file,
+            json.dumps(self.template_fingerprints, indent=2),
         )
+
+    # combines the boards entries into a single boards.txt file with all boards
+    def write_boards_txt(self, board_entries):
+        print("Combining individual board entries into a single boards.txt file")
         combined_boards = []
         with open(
-            os.path.join(self.package_directory, "boards_header.txt"),
+            os.path.join(self.template_directory, "boards_header.txt"),
             "r",
             encoding="UTF-8",
         ) as board_file:
             combined_boards.append(board_file.read())
-        os.remove(os.path.join(self.package_directory, "boards_header.txt"))
-        for board in self.boards_config:
+        for board_entry in board_entries:
             combined_boards.append("\n")
-            print(
-                f"Opening file for board {board.name} at {os.path.join(self.package_directory, f'boards_{board.name}.txt')}"
+            combined_boards.append(board_entry)
+        if self.package_tree is not None:
+            self.package_tree.add_text(
+                os.path.join(self.package_directory, "boards.txt"),
+                "\n".join(combined_boards),
             )
-            with open(
-                os.path.join(self.package_directory, f"boards_{board.name}.txt"),
-                "r",
-                encoding="UTF-8",
-            ) as board_file:
-                combined_boards.append(board_file.read())
-            print(
-                f"Deleting individual board file for board {board.name} at {os.path.join(self.package_directory, f'boards_{board.name}.txt')}"
+        else:
+            write_if_changed(
+                os.path.join(self.package_directory, "boards.txt"),
+                "\n".join(combined_boards),
             )
-            os.remove(os.path.join(self.package_directory, f"boards_{board.name}.txt"))
-        with open(
-            os.path.join(self.package_directory, "boards.txt"), "w", encoding="UTF-8"
-        ) as combined_file:
-            combined_file.write("\n".join(combined_boards))
-
-        # Run substitutions in all remaining _TEMPLATE files in the package directory
-        template_src_files = [
-            os.path.join(dp, f)
-            for dp, dn, filenames in os.walk(self.package_directory)
-            for f in filenames
-            if "_TEMPLATE" in f
+
+    # renders the templates for one board into the package directory
+    # returns the board's entry for boards.txt
+    # the files of a board that is not being built are kept from the previous build
+    def write_board_templates(self, board, board_templates, variant_templates):
+        variant_prefix = PackageTemplates.variant_prefix
+        render = self.process_file
+        if not self.is_built(board):
+            print(f"Reusing the template files for board {board.name}")
+
+            def render(template_name, destination, sub_dict):
+                self.rendered_outputs.add(destination)
+
+        else:
+            print(f"Customizing special template files for board {board.name}")
+        for template_name in board_templates:
+            dest_file = template_name.replace("_TEMPLATE", "_" + board.name).replace(
+                "pio_board", self.d["vendor_name"]
+            )
+            render(
+                template_name,
+                os.path.join(self.package_directory, dest_file),
+                board.d | self.d,
+            )
+        board_entry = self.templates.render("boards_TEMPLATE.txt", board.d | self.d)
+        # the variant version macros are inserted into the pins_arduino.h file for the board
+        board.d["variant_version_macros"] = self.templates.render(
+            "VARIANT_VERSION_TEMPLATE.h", board.d | self.d
+        )
+
+        # Run substitutions in all of the variant templates for the board
+        if self.is_built(board):
+            print(f"Customizing remaining template files for board {board.name}")
+        variant_dir = os.path.join(self.package_directory, "variants", board.name)
+        for template_name in variant_templates:
+            render(
+                template_name,
+                os.path.join(
+                    variant_dir,
+                    template_name[len(variant_prefix) :].replace("_TEMPLATE", ""),
+                ),
+                board.d | self.d,
+            )
+        return board_entry
+
+    # the package templates, read if they haven't been, sorted into
+    # (board templates, board snippets, variant templates, package templates)
+    def template_groups(self):
+        if self.templates is None:
+            self.templates = PackageTemplates(self.template_directory)
+        # templates rendered once for each board, with the board name added to the output name
+        board_templates = [
+            "boards/pio_board_TEMPLATE.json",
+            "scripts/jlink/debug_custom_TEMPLATE.json",
+            "scripts/openocd/daplink_samdx1_TEMPLATE.cfg",
+            "scripts/openocd/jlink_samdx1_TEMPLATE.cfg",
+        ]
+        # templates only rendered in memory, to be put into other files
+        board_snippets = ["boards_TEMPLATE.txt", "VARIANT_VERSION_TEMPLATE.h"]
+        variant_templates = [
+            name
+            for name in self.templates.names()
+            if name.startswith(PackageTemplates.variant_prefix)
+        ]
+        package_templates = [
+            name
+            for name in self.templates.names()
+            if name not in board_templates + board_snippets + variant_templates
+        ]
+        return board_templates, board_snippets, variant_templates, package_templates
+
+    # checks every template for placeholders without a value, for every board, and raises an
+    # error listing all of them
+    def check_template_values(
+        self, board_templates, variant_templates, package_templates
+    ):
+        missing = self.template_value_errors(
+            board_templates, variant_templates, package_templates
+        )
+        if missing:
+            print("No value provided for these template placeholders:")
+            for entry in missing:
+                print(f"  {entry}")
+            raise RuntimeError("Missing template values")
+
+    # returns every template placeholder without a value, for every board
+    # build_values are values only set part way through the build, which count as present
+    def template_value_errors(
+        self, board_templates, variant_templates, package_templates, build_values=None
+    ):
+        build_values = build_values or {}
+        missing = []
+        for board in self.boards_config:
+            sub_dict = build_values | board.d | self.d
+            for template_name in board_templates:
+                for key in self.templates.missing_values(template_name, sub_dict):
+                    missing.append(f"{template_name} for {board.name}: ${key}")
+            # the variant version macros are rendered just before the variant templates
+            sub_dict = sub_dict | {"variant_version_macros": ""}
+            for template_name in variant_templates:
+                for key in self.templates.missing_values(template_name, sub_dict):
+                    missing.append(f"{template_name} for {board.name}: ${key}")
+        for template_name in package_templates:
+            for key in self.templates.missing_values(
+                template_name, build_values | self.d
+            ):
+                missing.append(f"{template_name}: ${key}")
+        return missing
+
+    # checks the configuration for every problem that would otherwise only show up part of
+    # the way through a build, without copying, cloning or compiling anything
+    # returns a list of all of the problems found
+    def preflight_check(self):
+        problems = list(self.config_errors)
+
+        # every template placeholder must have a value for every board
+        template_paths = [
+            self.template_directory,
+            os.path.join(self.template_directory, "boards_header.txt"),
+            os.path.join(self.template_directory, "variants", "variant_template"),
         ]
-        for file_name in template_src_files:
-            if os.path.isfile(file_name):
-                print(f"Processing template for {file_name}")
-                self.process_file(file_name, file_name.replace("_TEMPLATE", ""))
+        missing_paths = [path for path in template_paths if not os.path.exists(path)]
+        for path in missing_paths:
+            problems.append(f"Missing package template file or directory {path}")
+        if not missing_paths:
+            board_templates, board_snippets, variant_templates, package_templates = (
+                self.template_groups()
+            )
+            for name in board_templates + board_snippets:
+                if name not in self.templates.names():
+                    problems.append(f"Missing package template {name}")
+            # values the build sets as it goes
+            build_values = dict.fromkeys(
+                [
+                    "uf2_version_tag",
+                    "bootloader_dir",
+                    "bootloader_build_name",
+                    "bootloader_versioned_name",
+                    "bootloader_filename",
+                ],
+                "",
+            )
+            problems += self.template_value_errors(
+                [name for name in board_templates if name in self.templates.names()]
+                + [name for name in board_snippets if name in self.templates.names()],
+                variant_templates,
+                package_templates,
+                build_values,
+            )
+
+        # each board needs its own name, a short enough volume label and USB IDs that are
+        # numbers, and should have a known chip variant, its variant files and its own long
+        # name and USB IDs. Only --check treats the second kind as problems; a build just
+        # warns about them, since it works without them.
+        warnings = []
+        seen = {}
+        for board in self.boards_config:
+            supported = SAMDBoard.supported_chip_variants.get(board.chip_family, [])
+            if board.chip_variant not in supported:
+                warnings.append(
+                    f"{board.name}: chip variant {board.chip_variant} is not supported for {board.chip_family}; use one of {', '.join(supported)}"
+                )
+            for file_name in ["variant.h", "variant.cpp"]:
+                if not os.path.isfile(os.path.join(board.d["board_dir"], file_name)):
+                    warnings.append(
+                        f"{board.name}: no {file_name} in {board.d['board_dir']}"
+                    )
+            if len(board.d["volume_label"]) > 11:
+                problems.append(
+                    f"{board.name}: volume label {board.d['volume_label']} is longer than 11 characters"
+                )
+            try:
+                usb_ids = (
+                    f"USB VID/PID {int(board.d['usb_vid'], 0):#06x}/"
+                    f"{int(board.d['usb_pid'], 0):#06x}"
+                )
+            except ValueError:
+                problems.append(
+                    f"{board.name}: USB VID {board.d['usb_vid']} or PID {board.d['usb_pid']} is not a number"
+                )
+                usb_ids = None
+            for value, found in [
+                (f"board name {board.name}", problems),
+                (f"long board name {board.d['board_name_long']}", warnings),
+                (usb_ids, warnings),
+            ]:
+                if value is None:
+                    continue
+                if value in seen:
+                    found.append(f"{board.name}: same {value} as {seen[value]}")
+                else:
+                    seen[value] = board.name
+        if self.check:
+            return problems + warnings
+        for warning in warnings:
+            print(f"Warning: {warning}")
+        return problems
+
+    # runs the preflight checks and raises an error if there are any problems
+    def check_config(self):
+        start = time.perf_counter()
+        problems = self.preflight_check()
+        elapsed = time.perf_counter() - start
+        if problems:
+            print("Problems found in the configuration:")
+            for problem in problems:
+                print(f"  {problem}")
+            raise RuntimeError(
+                f"{len(problems)} problems found in the configuration in {elapsed:.3f}s"
+            )
+        print(
+            f"No problems found in the configuration of {len(self.boards_config)} boards in {elapsed:.3f}s"
+        )
+
+    # the HTTP client shared by all of the requests made for the build
+    def http_client(self):
+        if self.http is None:
+            self.http = CachedHttpClient(
+                os.path.join(self.cache_directory(), "http"),
+                timeout=float(self.d.get("http_timeout", 10)),
+                retries=int(self.d.get("http_retries", 3)),
+                offline=self.d.get("offline", "0") != "0",
+            )
+        return self.http
 
+    # finds the tag of the latest release of Adafruit's uf2 repo
+    # The answer from GitHub is cached. Within the cache TTL no request is made at all,
+    # after that the request is conditional so an unchanged release costs a 304 response.
+    # A tag can also be pinned in the package config, and when offline the last known tag
+    # is used.
     def check_uf2_version(self):
+        if self.uf2_release_checked:
+            return
+        if "uf2_version_tag" in self.d:
+            print(
+                f"Using the UF2 release tag {self.d['uf2_version_tag']} pinned in the package config"
+            )
+            return
+
         print("Checking the tag of the latest release of Adafruit's uf2 repo...")
-        response = requests.get(
-            "https://api.github.com/repos/adafruit/uf2-samdx1/releases/latest"
+        status_code, body = self.http_client().get(
+            "https://api.github.com/repos/adafruit/uf2-samdx1/releases/latest",
+            max_age=int(self.d.get("uf2_release_cache_ttl", 3600)),
         )
-        latest_release_tag = response.json()["tag_name"]
-        self.d["uf2_version_tag"] = latest_release_tag
+        if status_code != 200:
+            raise RuntimeError(
+                f"Could not get the latest release of Adafruit's uf2 repo (status {status_code})"
+            )
+        release = json.loads(body)
+        self.d["uf2_version_tag"] = release["tag_name"]
+        self.uf2_release_checked = True
         print(
-            f"The latest release of Adafruit's uf2 repo is tag {latest_release_tag}, published {response.json()['published_at']}"
+            f"The latest release of Adafruit's uf2 repo is tag {release['tag_name']}, published {release['published_at']}"
         )
 
+    # checks out the uf2 repo at the release tag into the build directory
+    # The checkout is made from a local mirror of the repo kept in the cache directory, so
+    # the network is only used to create the mirror and to fetch tags it doesn't have yet.
     def clone_uf2_repo(self):
+        tag = self.d["uf2_version_tag"]
+        repo_url = self.d.get(
+            "uf2_repo_url", "https://github.com/adafruit/uf2-samdx1.git"
+        )
+        offline = self.d.get("offline", "0") != "0"
+        mirror_dir = self.uf2_mirror_directory()
         print("Cloning Adafruit's uf2 repo...")
         with open(
             f"{self.build_directory}/bootloader_clone_log.txt", "w", encoding="UTF-8"
         ) as logfile:
-            command = f"git clone --depth 1 --branch {self.d['uf2_version_tag']} https://github.com/adafruit/uf2-samdx1.git {self.build_directory}/uf2-samdx1"
-            git_process = subprocess.run(
-                command,
-                shell=True,
-                stdout=logfile,
-                stderr=subprocess.STDOUT,
-                text=True,
-            )
-            if git_process.returncode:
+
+            def run_git(*args):
+                logfile.write(f"git {' '.join(args)}\n")
+                logfile.flush()
+                return subprocess.run(
+                    ["git", *args],
+                    stdout=logfile,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                ).returncode
+
+            if not os.path.isdir(mirror_dir):
+                if offline:
+                    raise RuntimeError(
+                        f"No local mirror of the uf2 repo at {mirror_dir} to build from while offline"
+                    )
+                print(f"Creating a local mirror of {repo_url} at {mirror_dir}")
+                if run_git("clone", "--mirror", repo_url, mirror_dir):
+                    raise RuntimeError(
+                        "Mirroring Adafruit uf2 repo failed. Please see the log file for details"
+                    )
+            elif run_git(
+                "-C", mirror_dir, "rev-parse", "-q", "--verify", f"refs/tags/{tag}"
+            ):
+                if offline:
+                    raise RuntimeError(
+                        f"The local mirror of the uf2 repo does not have tag {tag} and the build is offline"
+                    )
+                print(f"Fetching tag {tag} into the local uf2 repo mirror")
+                run_git("-C", mirror_dir, "remote", "set-url", "origin", repo_url)
+                if run_git("-C", mirror_dir, "fetch", "--prune", "origin"):
+                    raise RuntimeError(
+                        "Updating the local uf2 repo mirror failed. Please see the log file for details"
+                    )
+            else:
+                print(f"Using tag {tag} from the local uf2 repo mirror at {mirror_dir}")
+
+            # a checkout kept from the last build is reused if it is at the same tag
+            checkout_dir = f"{self.build_directory}/uf2-samdx1"
+            if (
+                self.keep_uf2_checkout
+                and self.uf2_checkout_commit() is not None
+                and not run_git("-C", checkout_dir, "reset", "-q", "--hard")
+            ):
+                print(f"Using the uf2 repo checkout at {tag} kept from the last build")
+                return
+            # a resumed build can have an out of date clone left from the failed build
+            if os.path.exists(f"{self.build_directory}/uf2-samdx1"):
+                shutil.rmtree(
+                    f"{self.build_directory}/uf2-samdx1", onexc=remove_readonly
+                )
+            # a local clone hard links the objects from the mirror instead of copying them
+            if run_git(
+                "clone",
+                "--branch",
+                tag,
+                mirror_dir,
+                f"{self.build_directory}/uf2-samdx1",
+            ):
                 print(
                     "Cloning Adafruit uf2 repo failed. Please see the log file for details"
                 )
             else:
                 print("Successfully cloned latest Adafruit uf2 repo")
 
+    # the local mirror of the uf2 repo in the cache directory
+    def uf2_mirror_directory(self):
+        return os.path.abspath(os.path.join(self.cache_directory(), "uf2-samdx1.git"))
+
+    # the commit the uf2 repo checkout in the build directory is at, or None if there is no
+    # checkout or it isn't at the commit of the release tag in the local mirror
+    def uf2_checkout_commit(self):
+        checkout_dir = f"{self.build_directory}/uf2-samdx1"
+        if not os.path.isdir(checkout_dir) or not os.path.isdir(
+            self.uf2_mirror_directory()
+        ):
+            return None
+        commits = [
+            subprocess.run(
+                ["git", "-C", directory, "rev-parse", "-q", "--verify", revision],
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+            for directory, revision in [
+                (checkout_dir, "HEAD"),
+                (
+                    self.uf2_mirror_directory(),
+                    f"refs/tags/{self.d['uf2_version_tag']}^{{commit}}",
+                ),
+            ]
+        ]
+        if not commits[0] or commits[0] != commits[1]:
+            return None
+        return commits[0]
+
     # gets all necessary paths for GCC and make and adds them to PATH
     # returns environment with these paths
     def get_paths(self):
+        if self.toolchain is None:
+            self.toolchain = self.find_toolchain()
+        self.gcc_version = self.toolchain["gcc_version"]
+        gcc_path = self.toolchain["gcc_path"]
         new_env = os.environ.copy()
-        # find GCC included with Adafruit SAMD package
-        gcc_tool_path = (
-            new_env["HOME"]
-            if "HOME" in new_env
-            else new_env["USERPROFILE"]
-            + "/"
-            + self.d["arduino15"]
-            + "/packages/adafruit/tools/arm-none-eabi-gcc"
-        )
-        # e.g. /Users/shurik/Library/Arduino15/packages/adafruit/tools/arm-none-eabi-gcc
-        if not os.path.exists(gcc_tool_path):
-            raise RuntimeError(
-                "Couldn't find arm-none-eabi-gcc. Make sure you have installed Adafruit SAMD boards package!"
-            )
-        # now look for latest version.
-        # we do not use just listdir since we want to make sure we do not include dotfiles
-        gcc_versions = sorted(glob.glob(gcc_tool_path + "/*"))
-        last_gcc_version = gcc_versions[-1]
-        gcc_path = f"{last_gcc_version}/bin"
-        print(f"Found GCC compiler at {gcc_path}")
         # add the paths to PATH env variable
         if "make_path" in self.d:
             if not os.path.exists(os.path.join(self.d["make_path"], "make.exe")):
@@ -757,7 +3204,68 @@ class SAMDPackage:
             new_env["PATH"] = os.pathsep.join([new_env["PATH"], gcc_path])
         return new_env
 
-    def update_make_for_windows(self):
+    # finds the newest working GCC included with the Adafruit SAMD package
+    # The versions are compared by their numbers, so 10-2020q4 is newer than 9-2019q4, and
+    # the newest one whose arm-none-eabi-gcc runs is used. What was found is saved in the
+    # cache directory along with the modification times of the tools directories, so later
+    # builds only search again when a toolchain has been installed or removed.
+    def find_toolchain(self):
+        home = os.environ.get("HOME", os.environ.get("USERPROFILE", ""))
+        gcc_tool_path = os.path.join(
+            home, self.d["arduino15"], "packages/adafruit/tools/arm-none-eabi-gcc"
+        )
+        # e.g. /Users/shurik/Library/Arduino15/packages/adafruit/tools/arm-none-eabi-gcc
+        if not os.path.exists(gcc_tool_path):
+            raise RuntimeError(
+                "Couldn't find arm-none-eabi-gcc. Make sure you have installed Adafruit SAMD boards package!"
+            )
+        # we do not use just listdir since we want to make sure we do not include dotfiles
+        gcc_directories = sorted(glob.glob(gcc_tool_path + "/*"))
+        signature = [
+            [os.path.basename(gcc_directory), os.stat(gcc_directory).st_mtime_ns]
+            for gcc_directory in gcc_directories
+        ]
+        cache_file = os.path.join(self.cache_directory(), "toolchain.json")
+        if os.path.isfile(cache_file):
+            with open(cache_file, "r", encoding="UTF-8") as toolchain_file:
+                toolchain = json.load(toolchain_file)
+            if (
+                toolchain["tools_path"] == gcc_tool_path
+                and toolchain["signature"] == signature
+            ):
+                print(f"Using GCC compiler at {toolchain['gcc_path']}")
+                return toolchain
+
+        # now look for latest version.
+        for gcc_directory in sorted(
+            gcc_directories, key=toolchain_version_key, reverse=True
+        ):
+            gcc_path = os.path.join(gcc_directory, "bin")
+            gcc = shutil.which("arm-none-eabi-gcc", path=gcc_path)
+            if gcc is None:
+                print(f"No arm-none-eabi-gcc in {gcc_path}, skipping it")
+                continue
+            result = subprocess.run([gcc, "--version"], capture_output=True, text=True)
+            if result.returncode or not result.stdout.strip():
+                print(f"{gcc} --version failed, skipping it")
+                continue
+            toolchain = {
+                "tools_path": gcc_tool_path,
+                "signature": signature,
+                "gcc_path": gcc_path,
+                "gcc_version": f"{os.path.basename(gcc_directory)}: {result.stdout.splitlines()[0]}",
+            }
+            print(f"Found GCC compiler at {gcc_path}")
+            print(toolchain["gcc_version"])
+            os.makedirs(self.cache_directory(), exist_ok=True)
+            with open(cache_file, "w", encoding="UTF-8") as toolchain_file:
+                json.dump(toolchain, toolchain_file, indent=2)
+            return toolchain
+        raise RuntimeError(
+            f"Couldn't find a working arm-none-eabi-gcc in {gcc_tool_path}. Make sure you have installed Adafruit SAMD boards package!"
+        )
+
+    def update_make_for_windows(self, uf2_directory="."):
         print("Tweaking the make file for Windows")
         replacements = {
             # fix the mkdir to the windows version (no -p)
@@ -770,8 +3278,13 @@ class SAMDPackage:
             "git describe --dirty --always --tags": "git describe --always --tags",
         }
 
-        os.rename("Makefile", "archive_Makefile")
-        with open("archive_Makefile") as in_file, open("Makefile", "w") as outfile:
+        makefile = os.path.join(uf2_directory, "Makefile")
+        archive_makefile = os.path.join(uf2_directory, "archive_Makefile")
+        # a checkout that was kept or already built still has the original make file in the
+        # archive, so the tweak is made from that again rather than from the tweaked one
+        if not os.path.isfile(archive_makefile):
+            os.replace(makefile, archive_makefile)
+        with open(archive_makefile) as in_file, open(makefile, "w") as outfile:
             i = 1
             for line in in_file:
                 # print(i, line)
@@ -784,27 +3297,36 @@ class SAMDPackage:
 
     # compress already constructed package directory into a zip archive and
     # record archive size and SHA256 checksum
+    # The checksum and size are computed as the archive is written, without reading it back,
+    # and the archive is reproducible, so unchanged package files give the same checksum.
     def package_archive(self):
         # archive_filename = f"{self.config_directory}/{self.name}-{self.version}"
         archive_filename = (
             f"{self.d['package_name'].replace(' ','').lower()}-{self.package_version}"
         )
         print(f"Creating package archive at {archive_filename}.zip")
-        zip_archive = shutil.make_archive(
-            os.path.join(
-                self.build_directory,
-                archive_filename,
-            ),
-            "zip",
-            root_dir=self.build_directory,
-            # base_dir=self.version,
-            base_dir="current",
-        )
-        archive_size = os.path.getsize(zip_archive)
-        # compute hash:
-        with open(zip_archive, "rb") as f:
-            bytes = f.read()  # read entire file as bytes
-            hash = hashlib.sha256(bytes).hexdigest()
+        zip_archive = os.path.join(self.build_directory, archive_filename + ".zip")
+        compression_level = int(self.d.get("archive_compression_level", 6))
+        archive_jobs = int(self.d.get("archive_jobs", os.cpu_count() or 1))
+        with open(zip_archive, "wb") as archive_file:
+            hashing_file = HashingWriter(archive_file)
+            if self.package_tree is not None:
+                write_reproducible_zip_entries(
+                    hashing_file,
+                    self.package_tree.zip_entries("current"),
+                    compression_level,
+                    archive_jobs,
+                )
+            else:
+                write_reproducible_zip(
+                    hashing_file,
+                    self.build_directory,
+                    "current",
+                    compression_level,
+                    archive_jobs,
+                )
+        archive_size = hashing_file.size
+        hash = hashing_file.hexdigest()
 
         print(
             f"Created package archive, size {archive_size} bytes,\n SHA256 hash: {hash}"
@@ -814,12 +3336,9 @@ class SAMDPackage:
         self.d["archive_size"] = archive_size
         self.d["archive_checksum"] = hash
 
-    # write json index file
-    def write_index_json(self):
-        # see structure specifications here: https://arduino.github.io/arduino-cli/1.4/package_index_json-specification/
-
-        # create the package structure
-        package_template = {
+    # the basic package info for the json index file
+    def package_index_template(self):
+        return {
             "name": self.d["vendor_name_long"],
             "maintainer": self.d["maintainer_name"],
             "websiteURL": self.d["info_url"],
@@ -829,7 +3348,10 @@ class SAMDPackage:
             "tools": [],
         }
 
-        # read the exiting index file if it exists, to preserve previous versions
+    # reads the existing index file if it exists, to preserve previous versions
+    # this only needs the package config, so it can run while the package is being built
+    def read_package_index(self):
+        package_template = self.package_index_template()
         if (
             "package_index_file" in self.d
             and self.d["package_index_file"]
@@ -841,12 +3363,13 @@ class SAMDPackage:
                 )
                 packages = json.load(indexfile)
         elif "package_index_url" in self.d and self.d["package_index_url"]:
-            response = requests.get(self.d["package_index_url"])
-            if response.status_code == 200:
+            # the index is only downloaded again if it has changed since the cached copy
+            status_code, body = self.http_client().get(self.d["package_index_url"])
+            if status_code == 200:
                 print(
                     f"Found existing package index at {self.d['package_index_url']}, reading it to preserve previous versions"
                 )
-                packages = response.json()
+                packages = json.loads(body)
             else:
                 print(
                     f"No existing package index found at {self.d['package_index_url']}, creating a new one"
@@ -855,10 +3378,22 @@ class SAMDPackage:
         else:
             print("No existing package index found, creating a new one")
             packages = {"packages": [copy.deepcopy(package_template)]}
+        self.existing_index = packages
 
-        existing_platforms: list = []
+    # write json index file
+    def write_index_json(self):
+        # see structure specifications here: https://arduino.github.io/arduino-cli/1.4/package_index_json-specification/
+
+        # create the package structure
+        package_template = self.package_index_template()
+        if self.existing_index is None:
+            self.read_package_index()
+        packages = self.existing_index
+
+        # platforms in the existing index, keyed by (name, architecture, version)
+        platforms_by_key = {}
         if "packages" in packages and len(packages["packages"]) > 0:
-            existing_package = copy.deepcopy(packages["packages"][0])
+            existing_package = packages["packages"][0]
             # verify that the basic package info matches the existing one if it exists
             if (
                 existing_package["name"] != package_template["name"]
@@ -869,19 +3404,11 @@ class SAMDPackage:
                 raise RuntimeError(
                     "Existing package index has different basic info (name, maintainer, websiteURL, or email). Please resolve this conflict before proceeding."
                 )
-            # Remove any outdated platform entries for the current version if they exist, to avoid conflicts with the new platform entry we're adding below.
             # NOTE: According to the specification, 3rd party vendors should use a single package within the package index.
-            if "platforms" in existing_package:
-                existing_platforms = existing_package["platforms"]
-                for idx, platform in enumerate(existing_platforms):
-                    if (
-                        platform["name"] == self.d["package_name"]
-                        and platform["version"] == self.d["package_version"]
-                    ):
-                        print(
-                            f"Found outdated platform info for version {self.d['package_version']}, removing it."
-                        )
-                        existing_platforms.pop(idx)
+            for platform in existing_package.get("platforms", []):
+                platforms_by_key[
+                    (platform["name"], platform["architecture"], platform["version"])
+                ] = platform
 
         # let's create the current version of our SAMD platform
         samd_current = {
@@ -899,27 +3426,620 @@ class SAMDPackage:
         }
         for board in self.boards_config:
             samd_current["boards"].append({"name": board.d["board_name_long"]})
-        # add the new platform entry to the package
-        existing_platforms.append(samd_current)
-        existing_platforms = multikeysort(
-            existing_platforms,
-            ["architecture", "name", "-version"],
-            functions={"version": lambda x: Version(x["version"])},
+
+        # Replace any outdated platform entry for the current version, to avoid conflicts
+        # with the new platform entry.
+        current_key = (
+            samd_current["name"],
+            samd_current["architecture"],
+            samd_current["version"],
         )
-        packages["packages"][0]["platforms"] = copy.deepcopy(existing_platforms)
+        if current_key in platforms_by_key:
+            print(
+                f"Found outdated platform info for version {self.d['package_version']}, removing it."
+            )
+            if (
+                platforms_by_key[current_key].get("checksum")
+                == samd_current["checksum"]
+            ):
+                print(
+                    "The package archive is byte-identical to the one already in the index and does not need to be uploaded again."
+                )
+        platforms_by_key[current_key] = samd_current
+
+        # sort by architecture and name, newest version first
+        # each version is parsed once; the second sort is stable so versions stay in order
+        platforms = sorted(
+            platforms_by_key.values(),
+            key=lambda platform: Version(platform["version"]),
+            reverse=True,
+        )
+        platforms.sort(
+            key=lambda platform: (platform["architecture"], platform["name"])
+        )
+        packages["packages"][0]["platforms"] = platforms
 
         # now save to json
-        indexfile_name = (
+        # json.dump writes the index out in chunks as it is encoded; INDEX_JSON_INDENT = 0
+        # writes compact JSON without any whitespace
+        indexfile_name = self.index_file()
+        indent = int(self.d.get("index_json_indent", 2))
+        with open(indexfile_name, "w", encoding="UTF-8") as indexfile:
+            if indent:
+                json.dump(packages, indexfile, indent=indent)
+            else:
+                json.dump(packages, indexfile, separators=(",", ":"))
+
+    # the json index file written into the build directory
+    def index_file(self):
+        return (
             self.build_directory + "/package_" + self.d["vendor_name"] + "_index.json"
         )
-        with open(indexfile_name, "w", encoding="UTF-8") as indexfile:
-            json.dump(packages, indexfile, indent=2)
 
     def clean_build_directory(self):
+        if self.keep_uf2_checkout:
+            return
         # remove cloned repo
         if os.path.exists(f"{self.build_directory}/uf2-samdx1"):
             shutil.rmtree(f"{self.build_directory}/uf2-samdx1", onexc=remove_readonly)
 
 
-# cSpell:words hughdbrown esque DARDUINO onexc multikeysort mfloat mfpu
+# A long running build server that keeps the package state warm between builds.
+# Builds are asked for over HTTP on the local machine and run one at a time:
+#   POST /build   runs a build and answers with its result as JSON. The request body is an
+#                 optional JSON object with the same choices as makeboard.py: "boards",
+#                 "chip_family", "changed_since", "changed" and "check".
+#   GET /status   answers with the number of builds run, whether one is running and the
+#                 result of the last one.
+# Each build reads the configs into a new SAMDPackage, so it sees any change to them, but
+# carries over what the last build already worked out: the parsed board configs, the
+# package templates (while the template directory is unchanged), the GCC toolchain, the
+# HTTP client with its open connections and the uf2 repo checkout.
+class BuildServer:
+    def __init__(self, config_directory):
+        self.config_directory = config_directory
+        self.package = None
+        self.config_cache = None
+        self.template_hash = None
+        self.builds = 0
+        self.last_result = None
+        self.building = threading.Event()
+        self._lock = threading.Lock()
+
+    # a new package for the next build, with the warm state of the last one
+    def new_package(self, check=False):
+        previous = self.package
+        package = SAMDPackage(
+            self.config_directory, check=check, config_cache=self.config_cache
+        )
+        self.config_cache = package.config_cache
+        package.keep_uf2_checkout = True
+        template_hash = tree_sha256(package.template_directory)
+        if previous is not None:
+            package.toolchain = previous.toolchain
+            package.http = previous.http
+            if template_hash == self.template_hash:
+                package.templates = previous.templates
+        self.template_hash = template_hash
+        self.package = package
+        return package
+
+    # runs one build and returns its result
+    # the result has the boards built, the files made with their sizes and SHA256 hashes,
+    # the timing of each stage and, if the build failed, the error
+    def build(self, request):
+        with self._lock:
+            self.building.set()
+            start = time.perf_counter()
+            result = {"ok": False, "error": None}
+            package = None
+            try:
+                package = self.new_package(check=bool(request.get("check")))
+                if request.get("check"):
+                    problems = package.preflight_check()
+                    result["problems"] = problems
+                    result["ok"] = not problems
+                else:
+                    if (
+                        request.get("boards")
+                        or request.get("chip_family")
+                        or request.get("changed_since")
+                        or request.get("changed")
+                    ):
+                        package.select_boards(
+                            request.get("boards"),
+                            request.get("chip_family"),
+                            request.get("changed_since"),
+                            bool(request.get("changed")),
+                        )
+                    package.run_build()
+                    result["ok"] = True
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                self.building.clear()
+            if package is not None:
+                result["boards_built"] = [
+                    board.name for board in package.build_boards()
+                ]
+                if result["ok"] and not request.get("check"):
+                    result["artifacts"] = self.artifacts(package)
+                result["stages"] = package.profiler.stages
+            result["elapsed_s"] = round(time.perf_counter() - start, 6)
+            self.builds += 1
+            self.last_result = result
+            return result
+
+    # the files a build made, with their sizes and SHA256 hashes
+    def artifacts(self, package):
+        filenames = [
+            os.path.join(package.build_directory, "build_report.json"),
+            package.index_file(),
+        ]
+        if "archive_filename" in package.d:
+            filenames.insert(
+                0, os.path.join(package.build_directory, package.d["archive_filename"])
+            )
+        for board in package.build_boards():
+            bootloader_dir = os.path.join(
+                package.package_directory, "bootloaders", board.name
+            )
+            if os.path.isdir(bootloader_dir):
+                filenames += [
+                    os.path.join(bootloader_dir, file_name)
+                    for file_name in sorted(os.listdir(bootloader_dir))
+                ]
+        return [
+            {
+                "path": os.path.abspath(filename),
+                "size": os.path.getsize(filename),
+                "sha256": file_sha256(filename),
+            }
+            for filename in filenames
+            if os.path.isfile(filename)
+        ]
+
+    # answers build and status requests until interrupted
+    def serve(self, host="127.0.0.1", port=8765):
+        serve_json(
+            {
+                ("GET", "/status"): self.status,
+                ("POST", "/build"): self.build_response,
+            },
+            host,
+            port,
+            "Build server",
+        )
+
+    def status(self, request):
+        return 200, {
+            "builds": self.builds,
+            "building": self.building.is_set(),
+            "last_result": self.last_result,
+        }
+
+    def build_response(self, request):
+        result = self.build(request)
+        return (200 if result["ok"] else 500), result
+
+
+# Builds bootloaders for a build on another machine, or in another process on the same one.
+# The coordinating build sends the board's board.mk and board_config.h, its version and the
+# UF2 tag and repo; the worker checks out the uf2 repo at that tag, builds the bootloader with
+# its own toolchain and sends back the built files with their SHA256 hashes and the make
+# output. Requests are answered over HTTP on:
+#   POST /build   builds one bootloader
+#   GET /status   answers with the number of bootloaders built and whether one is building
+# A worker builds one bootloader at a time; start more workers to build more at once.
+# Workers don't check who is asking them to build, so only run them on trusted networks.
+class BootloaderWorker:
+    def __init__(self, package, work_directory):
+        self.package = package
+        self.work_directory = os.path.abspath(work_directory)
+        self.builds = 0
+        self.building = threading.Event()
+        self._lock = threading.Lock()
+        # the uf2 repo mirror and checkout are kept in the work directory
+        self.package.build_directory = self.work_directory
+        self.package.d["cache_directory"] = self.work_directory
+        self.package.keep_uf2_checkout = True
+        os.makedirs(self.work_directory, exist_ok=True)
+
+    # builds the bootloader in the request and returns the result
+    def build(self, request):
+        board_name = request["board"]
+        # the board name becomes part of paths in the uf2 repo
+        if not re.fullmatch(r"[\w.-]+", board_name):
+            raise ValueError(f"Invalid board name {board_name}")
+        with self._lock:
+            self.building.set()
+            try:
+                self.package.d["uf2_version_tag"] = request["uf2_version_tag"]
+                self.package.d["uf2_repo_url"] = request["uf2_repo_url"]
+                self.package.clone_uf2_repo()
+                uf2_directory = os.path.join(self.work_directory, "uf2-samdx1")
+                board_directory = os.path.join(uf2_directory, "boards", board_name)
+                os.makedirs(board_directory, exist_ok=True)
+                for file_name in ["board.mk", "board_config.h"]:
+                    write_if_changed(
+                        os.path.join(board_directory, file_name),
+                        request["files"][file_name],
+                    )
+                # files left from an earlier build of the board must not be sent back
+                output_directory = os.path.join(uf2_directory, "build", board_name)
+                if os.path.exists(output_directory):
+                    shutil.rmtree(output_directory, onexc=remove_readonly)
+
+                new_env = self.package.get_paths()
+                if self.package.d["build_os"].lower() == "windows":
+                    self.package.update_make_for_windows(uf2_directory)
+                board = SAMDBoard.from_state(
+                    {
+                        "name": board_name,
+                        "board_version": request["board_version"],
+                        "d": {},
+                    }
+                )
+                monitor = BuildMonitor("none")
+                built = board.build_bootloader(
+                    new_env,
+                    uf2_directory,
+                    request.get("make_jobs"),
+                    True,
+                    monitor,
+                    self.package.compiler_cache(new_env),
+                )
+                with open(
+                    os.path.join(
+                        self.work_directory, f"{board_name}_bootloader_build_log.txt"
+                    ),
+                    "r",
+                    encoding="UTF-8",
+                ) as logfile:
+                    log = logfile.read()
+                # the same files that go into the package from a local build
+                files = {}
+                if built:
+                    for file_name in bootloader_file_names(
+                        output_directory,
+                        f"bootloader-{board_name}-{request['uf2_version_tag']}",
+                    ):
+                        with open(
+                            os.path.join(output_directory, file_name), "rb"
+                        ) as built_file:
+                            data = built_file.read()
+                        files[file_name] = {
+                            "data": base64.b64encode(data).decode("ascii"),
+                            "sha256": hashlib.sha256(data).hexdigest(),
+                        }
+                self.builds += 1
+                print(
+                    f"Bootloader for {board_name} {'built' if built else 'FAILED'} in {monitor.durations[board_name]:.1f}s"
+                )
+                return {
+                    "ok": built,
+                    "files": files,
+                    "log": log,
+                    "duration_s": round(monitor.durations[board_name], 6),
+                    "gcc_version": self.package.gcc_version,
+                }
+            finally:
+                self.building.clear()
+
+    def status(self, request):
+        return 200, {"builds": self.builds, "building": self.building.is_set()}
+
+    def build_response(self, request):
+        try:
+            return 200, self.build(request)
+        except (KeyError, ValueError) as e:
+            return 400, {"error": f"Invalid build request: {e!r}"}
+        except Exception as e:
+            print(f"Building the bootloader for {request.get('board')} raised {e!r}")
+            return 500, {"error": repr(e)}
+
+    # answers build and status requests until interrupted
+    def serve(self, host="127.0.0.1", port=8766):
+        serve_json(
+            {
+                ("GET", "/status"): self.status,
+                ("POST", "/build"): self.build_response,
+            },
+            host,
+            port,
+            "Bootloader worker",
+        )
+
+
+# answers JSON requests over HTTP until interrupted
+# routes maps (method, path) to a function taking the JSON request body (an empty object
+# for GET) and returning (HTTP status, JSON-serializable answer)
+def serve_json(routes, host, port, name):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, value):
+            body = json.dumps(value, indent=2).encode("UTF-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_request(self, method):
+            if (method, self.path) not in routes:
+                self.send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+            request = {}
+            if method == "POST":
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(request, dict):
+                        raise ValueError("the request must be a JSON object")
+                except ValueError as e:
+                    self.send_json(400, {"error": f"Invalid request: {e}"})
+                    return
+            self.send_json(*routes[(method, self.path)](request))
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+    http_server = ThreadingHTTPServer((host, port), Handler)
+    print(f"{name} listening on http://{host}:{port}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopping the {name.lower()}")
+    finally:
+        http_server.server_close()
+
+
+# Watches the board configs and the package templates and keeps the package directory up to
+# date as they are edited. After one full build, each change is mapped to the outputs that
+# depend on it and only those are made again:
+#   a board's variant.h or variant.cpp      that file is copied into the board's variant
+#   a board's board-config.ini              the board's template files and boards.txt are
+#                                           rendered again, and its bootloader is rebuilt
+#                                           if anything that goes into it changed
+#   a template                              that template's outputs, for every board
+#   boards_header.txt                       boards.txt
+#   any other file in the template folder   that file is copied, or removed, in the package
+#   anything else, e.g. package-config.ini  a full build
+# The package archive and the json index file are only made by a full build.
+class PackageWatcher:
+    def __init__(self, config_directory, interval=0.25):
+        self.config_directory = config_directory
+        self.interval = interval
+        self.package = None
+
+    # runs a full build with a new package, keeping the uf2 repo checkout for the updates
+    def full_build(self):
+        package = SAMDPackage(self.config_directory)
+        # the package directory has to be on disk to be updated
+        package.d["package_in_memory"] = "0"
+        package.keep_uf2_checkout = True
+        if self.package is not None:
+            package.toolchain = self.package.toolchain
+            package.http = self.package.http
+        self.package = package
+        package.run_build()
+
+    # the modification time and size of every file being watched
+    def snapshot(self):
+        files = {}
+        for directory in [self.config_directory, self.package.template_directory]:
+            for dirpath, dirnames, filenames in os.walk(directory):
+                for name in filenames:
+                    # leave out editor swap and backup files
+                    if name.startswith(".") or name.endswith("~"):
+                        continue
+                    path = os.path.normpath(os.path.join(dirpath, name))
+                    try:
+                        file_stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files[path] = (file_stat.st_mtime_ns, file_stat.st_size)
+        return files
+
+    # makes the first full build, then updates the package whenever a file changes until
+    # interrupted
+    def watch(self):
+        self.full_build()
+        files = self.snapshot()
+        print(
+            f"\nWatching {self.config_directory} and {self.package.template_directory} for changes"
+        )
+        try:
+            while True:
+                time.sleep(self.interval)
+                new_files = self.snapshot()
+                if new_files == files:
+                    continue
+                # editors often write a file in more than one step, so wait for them to finish
+                time.sleep(0.1)
+                new_files = self.snapshot()
+                changed = sorted(
+                    path
+                    for path in files.keys() | new_files.keys()
+                    if files.get(path) != new_files.get(path)
+                )
+                files = new_files
+                start = time.perf_counter()
+                try:
+                    self.update(changed)
+                except Exception as e:
+                    print(f"Updating the package failed: {e!r}")
+                    continue
+                print(
+                    f"Package updated in {time.perf_counter() - start:.3f}s; watching for changes"
+                )
+        except KeyboardInterrupt:
+            print("Stopped watching for changes")
+
+    # updates the package for the changed files
+    def update(self, changed):
+        package = self.package
+        template_directory = os.path.normpath(package.template_directory)
+        boards_by_dir = {
+            os.path.normpath(board.d["board_dir"]): board
+            for board in package.boards_config
+        }
+        changed_templates = set()
+        changed_boards = {}
+        template_files = []
+        for path in changed:
+            print(f"Changed: {path}")
+            directory, file_name = os.path.split(path)
+            if path.startswith(template_directory + os.sep):
+                name = os.path.relpath(path, template_directory).replace(os.sep, "/")
+                if "_TEMPLATE" in file_name or name == "boards_header.txt":
+                    changed_templates.add(name)
+                else:
+                    template_files.append(path)
+            elif directory in boards_by_dir and file_name in [
+                "variant.h",
+                "variant.cpp",
+            ]:
+                board = boards_by_dir[directory]
+                if os.path.isfile(path):
+                    destination = os.path.join(
+                        package.package_directory, "variants", board.name, file_name
+                    )
+                    print(f"Copying {path} to {destination}")
+                    shutil.copy2(path, destination)
+            elif (
+                directory in boards_by_dir
+                and file_name == "board-config.ini"
+                and os.path.isfile(path)
+            ):
+                changed_boards[directory] = boards_by_dir[directory]
+            elif (
+                os.path.basename(directory) == "your-variant" or "EXAMPLE" in file_name
+            ):
+                continue
+            else:
+                # the package config or the set of boards changed
+                print("Running a full build")
+                self.full_build()
+                return
+
+        for board_dir, old_board in changed_boards.items():
+            if not self.update_board(old_board, os.path.basename(board_dir)):
+                print("Running a full build")
+                self.full_build()
+                return
+        for path in template_files:
+            self.update_template_file(path)
+        if changed_templates:
+            package.templates = PackageTemplates(package.template_directory)
+        if changed_boards or changed_templates:
+            self.render_templates(
+                changed_templates,
+                [
+                    board
+                    for board in package.boards_config
+                    if os.path.normpath(board.d["board_dir"]) in changed_boards
+                ],
+            )
+
+    # reads the board config again and rebuilds the bootloader if it needs to be
+    # returns False if the board can't be updated without a full build
+    def update_board(self, old_board, board_dir):
+        package = self.package
+        board = package.read_board_config(None, board_dir)
+        if board.name != old_board.name:
+            return False
+        package.set_bootloader_names(board)
+        package.boards_config[package.boards_config.index(old_board)] = board
+        if package.bootloader_key(board) == package.bootloader_key(old_board):
+            return True
+        print(f"Rebuilding the bootloader for {board.name}")
+        bootloader_config_dir = (
+            f"{package.build_directory}/uf2-samdx1/boards/{board.d['board_name']}"
+        )
+        os.makedirs(bootloader_config_dir, exist_ok=True)
+        board.write_board_mk(bootloader_config_dir)
+        board.write_board_config(bootloader_config_dir, package.d)
+        selected_boards = package.selected_boards
+        package.selected_boards = {board.name}
+        try:
+            package.build_bootloaders()
+        finally:
+            package.selected_boards = selected_boards
+        package.copy_board_bootloader(board)
+        return True
+
+    # copies a changed file in the template folder into the package, or removes it
+    def update_template_file(self, path):
+        package = self.package
+        name = os.path.relpath(path, package.template_directory)
+        variant_template_dir = os.path.join("variants", "variant_template")
+        if name.startswith(variant_template_dir + os.sep):
+            destinations = [
+                os.path.join(
+                    package.package_directory,
+                    "variants",
+                    board.name,
+                    os.path.relpath(name, variant_template_dir),
+                )
+                for board in package.boards_config
+            ]
+        else:
+            destinations = [os.path.join(package.package_directory, name)]
+        for destination in destinations:
+            if os.path.isfile(path):
+                print(f"Copying {path} to {destination}")
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copy2(path, destination)
+            elif os.path.exists(destination):
+                print(f"Removing {destination}")
+                os.remove(destination)
+
+    # renders the changed templates for every board and every template for the changed
+    # boards, and writes boards.txt again if anything that goes into it changed
+    def render_templates(self, template_names, changed_boards):
+        package = self.package
+        board_templates, board_snippets, variant_templates, package_templates = (
+            package.template_groups()
+        )
+        package.check_template_values(
+            board_templates + board_snippets, variant_templates, package_templates
+        )
+        # the variant version macros go into a variant template
+        if "VARIANT_VERSION_TEMPLATE.h" in template_names:
+            template_names = template_names | set(variant_templates)
+        for board in package.boards_config:
+            if board in changed_boards:
+                package.write_board_templates(board, board_templates, variant_templates)
+            else:
+                package.write_board_templates(
+                    board,
+                    [name for name in board_templates if name in template_names],
+                    [name for name in variant_templates if name in template_names],
+                )
+        if changed_boards or template_names & {
+            "boards_TEMPLATE.txt",
+            "boards_header.txt",
+        }:
+            package.write_boards_txt(
+                [
+                    package.templates.render("boards_TEMPLATE.txt", board.d | package.d)
+                    for board in package.boards_config
+                ]
+            )
+        for template_name in package_templates:
+            if template_name in template_names:
+                package.process_file(
+                    template_name,
+                    os.path.join(
+                        package.package_directory,
+                        template_name.replace("_TEMPLATE", ""),
+                    ),
+                )
+
+
+# cSpell:words esque DARDUINO onexc mfloat mfpu
 # cSpell:words board_rgbled_data_pin board_rgbled_clock_pin larm_cortexM4lf_math
+# cSpell:words compressobj gmtime timegm isascii
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the full package build on synthetic board catalogs
+
+For each catalog size, a board_data tree with that many boards (a mix of SAMD21 and
+SAMD51/SAME51 variants) is generated in a temporary directory and run through every stage
+of SAMDPackage. Nothing touches the network or the real toolchain: the UF2 release tag is
+pinned, the uf2 repo is a local git repo whose Makefile just writes placeholder bootloader
+files, and the GCC tools directory is an empty stand-in.
+
+The wall time, CPU time and peak Python memory of each stage are saved as JSON. Given a
+baseline from an earlier run, stages that got slower than the tolerance are reported and
+the script exits with an error.
+
+Usage:
+    python benchmark.py --boards 1 10 100 500 --output bench_results.json
+    python benchmark.py --baseline bench_results.json
+"""
+
+import argparse
+import configparser
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+import SAMDconfig
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+UF2_TAG = "v3.16.0"
+
+# chip family and variant for the synthetic boards, used in turn
+CHIP_VARIANTS = [
+    ("SAMD21", "SAMD21G18A"),
+    ("SAMD51", "SAMD51J19A"),
+    ("SAMD21", "SAMD21E18A"),
+    ("SAMD51", "SAMD51J20A"),
+    ("SAME51", "SAME51J19A"),
+    ("SAMD51", "SAMD51G19A"),
+]
+
+# stages checked against the baseline by default
+CHECKED_STAGES = [
+    "read_board_configs",
+    "write_platform_templates",
+    "package_archive",
+    "write_index_json",
+]
+
+# stand-in for the uf2 repo Makefile: writes the files a real bootloader build leaves behind
+STUB_MAKEFILE = f"""all:
+\t@test -f boards/$(BOARD)/board_config.h
+\t@mkdir -p build/$(BOARD)
+\t@echo bin > build/$(BOARD)/bootloader-$(BOARD)-{UF2_TAG}.bin
+\t@echo hex > build/$(BOARD)/bootloader-$(BOARD)-{UF2_TAG}.hex
+\t@echo uf2 > build/$(BOARD)/update-bootloader-$(BOARD)-{UF2_TAG}.uf2
+"""
+
+# stand-in for arm-none-eabi-gcc, enough for get_paths to check its version
+STUB_GCC = """#!/bin/sh
+echo "arm-none-eabi-gcc (benchmark stub) 9.2.1"
+"""
+
+
+# creates a local git repo with a tagged stub Makefile to stand in for the uf2 repo
+def make_stub_uf2_repo(directory):
+    os.makedirs(os.path.join(directory, "boards"))
+    with open(os.path.join(directory, "Makefile"), "w", encoding="UTF-8") as makefile:
+        makefile.write(STUB_MAKEFILE)
+    with open(os.path.join(directory, "boards", ".keep"), "w", encoding="UTF-8"):
+        pass
+    git = ["git", "-C", directory, "-c", "user.name=bench", "-c", "user.email=bench@"]
+    for command in [
+        ["init", "-q"],
+        ["add", "-A"],
+        ["commit", "-q", "-m", "stub uf2 repo"],
+        ["tag", UF2_TAG],
+    ]:
+        subprocess.run(git + command, check=True)
+
+
+# writes a board_data directory with n_boards synthetic boards into root_dir
+def make_board_catalog(root_dir, n_boards, uf2_repo):
+    config_dir = os.path.join(root_dir, "board_data")
+    example_dir = os.path.join(REPO_DIRECTORY, "board_data", "your-variant")
+    with open(
+        os.path.join(example_dir, "board-config.ini"), "r", encoding="UTF-8"
+    ) as example_file:
+        example_config = example_file.read()
+
+    for board_number in range(n_boards):
+        chip_family, chip_variant = CHIP_VARIANTS[board_number % len(CHIP_VARIANTS)]
+        suffix = "m0" if chip_family == "SAMD21" else "m4"
+        board_name = f"bench{board_number:04d}_{suffix}"
+        board_config = (
+            example_config.replace(
+                "CHIP_FAMILY = SAMD51", f"CHIP_FAMILY = {chip_family}"
+            )
+            .replace("CHIP_VARIANT = SAMD51N19A", f"CHIP_VARIANT = {chip_variant}")
+            .replace("BOARD_NAME = stonefly_m4", f"BOARD_NAME = {board_name}")
+            .replace("USB_PID =  0x2402", f"USB_PID =  {0x2402 + board_number:#06x}")
+            .replace(
+                "BOARD_NAME_LONG = EnviroDIY Stonefly",
+                f"BOARD_NAME_LONG = Benchmark Board {board_number}",
+            )
+            .replace(
+                "BOARD_DEFINE_NAME = STONEFLY",
+                f"BOARD_DEFINE_NAME = BENCH{board_number:04d}",
+            )
+        )
+        if chip_family == "SAMD21":
+            # the SAMD51 USART options must be left out for a SAMD21
+            board_config = re.sub(r"(?m)^BOOT_\w+\s*=.*$", "", board_config)
+        board_dir = os.path.join(config_dir, board_name)
+        os.makedirs(board_dir)
+        with open(
+            os.path.join(board_dir, "board-config.ini"), "w", encoding="UTF-8"
+        ) as config_file:
+            config_file.write(board_config)
+        shutil.copy(
+            os.path.join(example_dir, "variant-EXAMPLE.h"),
+            os.path.join(board_dir, "variant.h"),
+        )
+        shutil.copy(
+            os.path.join(example_dir, "variant-EXAMPLE.cpp"),
+            os.path.join(board_dir, "variant.cpp"),
+        )
+
+    package_config = configparser.ConfigParser()
+    package_config["vendor"] = {
+        "VENDOR_NAME": "bench",
+        "VENDOR_NAME_LONG": "Benchmark Vendor",
+        "INFO_URL": "https://example.com/",
+        "HELP_URL": "https://example.com/help/",
+        "MAINTAINER_NAME": "Benchmark",
+        "VENDOR_EMAIL": "bench@example.com",
+    }
+    package_config["package"] = {
+        "PACKAGE_NAME": "Benchmark SAMD Boards",
+        "PACKAGE_VERSION": "1.0.0",
+        "PACKAGE_REPOSITORY": "https://example.com/repo",
+        "PACKAGE_ARCHIVE_URL": "https://example.com/archives/",
+        "PACKAGE_DEFINE_NAME": "BENCH_SAMD_BOARDS",
+    }
+    package_config["paths"] = {"BUILD_OS": "Linux", "ARDUINO15": "arduino15"}
+    package_config["build"] = {
+        "UF2_VERSION_TAG": UF2_TAG,
+        "UF2_REPO_URL": uf2_repo,
+        "BOOTLOADER_CACHE": "0",
+        "CLEAN_BUILD": "1",
+    }
+    with open(
+        os.path.join(config_dir, "package-config.ini"), "w", encoding="UTF-8"
+    ) as config_file:
+        package_config.write(config_file)
+    return config_dir
+
+
+# runs the whole pipeline on a catalog of n_boards boards and returns the stage records
+def run_benchmark(n_boards, work_dir, uf2_repo):
+    root_dir = os.path.join(work_dir, f"catalog_{n_boards}")
+    make_board_catalog(root_dir, n_boards, uf2_repo)
+    # stand-in for the Adafruit GCC tools directory that get_paths looks for
+    gcc_bin = os.path.join(
+        work_dir,
+        "home",
+        "arduino15/packages/adafruit/tools/arm-none-eabi-gcc/9-2019q4/bin",
+    )
+    os.makedirs(gcc_bin, exist_ok=True)
+    with open(os.path.join(gcc_bin, "arm-none-eabi-gcc"), "w") as gcc_file:
+        gcc_file.write(STUB_GCC)
+    os.chmod(os.path.join(gcc_bin, "arm-none-eabi-gcc"), 0o755)
+    os.environ["HOME"] = os.path.join(work_dir, "home")
+
+    cwd = os.getcwd()
+    os.chdir(root_dir)
+    tracemalloc.start()
+    try:
+        with open(os.path.join(root_dir, "build_output.txt"), "w") as log:
+            with redirect_stdout(log):
+                package = SAMDconfig.SAMDPackage("board_data")
+                package.template_directory = os.path.join(
+                    REPO_DIRECTORY, "PACKAGE_TEMPLATE"
+                )
+                for stage_name, description, run_stage, _ in package.build_stages():
+                    with package.profiler.stage(stage_name):
+                        run_stage()
+    finally:
+        tracemalloc.stop()
+        os.chdir(cwd)
+    stages = {
+        record["name"]: {
+            "wall_s": record["wall_s"],
+            "cpu_s": record["cpu_s"],
+            "peak_memory_bytes": record.get("peak_memory_bytes"),
+        }
+        for record in package.profiler.stages
+    }
+    return {
+        "boards": n_boards,
+        "total_wall_s": round(sum(s["wall_s"] for s in stages.values()), 6),
+        "stages": stages,
+    }
+
+
+# compares results against a baseline; returns a list of regression messages
+def compare_to_baseline(results, baseline, stages, tolerance, min_seconds):
+    regressions = []
+    for n_boards, result in results["catalogs"].items():
+        if n_boards not in baseline["catalogs"]:
+            continue
+        baseline_stages = baseline["catalogs"][n_boards]["stages"]
+        for stage_name in stages:
+            if stage_name not in result["stages"] or stage_name not in baseline_stages:
+                continue
+            new = result["stages"][stage_name]["wall_s"]
+            old = baseline_stages[stage_name]["wall_s"]
+            if new > old * (1 + tolerance) and new - old > min_seconds:
+                regressions.append(
+                    f"{stage_name} with {n_boards} boards: {old:.3f}s -> {new:.3f}s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--boards",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100, 500],
+        help="catalog sizes to benchmark",
+    )
+    parser.add_argument(
+        "--output", default="bench_results.json", help="file to save the results to"
+    )
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown relative to the baseline (default 0.25, i.e. 25%%)",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="ignore slowdowns smaller than this many seconds",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        default=CHECKED_STAGES,
+        help="stages compared against the baseline",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the generated catalogs and builds"
+    )
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="samd_bench_")
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "catalogs": {},
+    }
+    try:
+        uf2_repo = os.path.join(work_dir, "uf2-samdx1")
+        make_stub_uf2_repo(uf2_repo)
+        for n_boards in args.boards:
+            print(f"Benchmarking a catalog of {n_boards} boards...")
+            result = run_benchmark(n_boards, work_dir, uf2_repo)
+            results["catalogs"][str(n_boards)] = result
+            for stage_name, stage in result["stages"].items():
+                peak = stage["peak_memory_bytes"]
+                print(
+                    f"  {stage_name.ljust(28)} {stage['wall_s']:9.3f}s wall {stage['cpu_s']:9.3f}s CPU {peak / 1e6:9.2f} MB peak"
+                )
+            print(f"  {'total'.ljust(28)} {result['total_wall_s']:9.3f}s wall")
+    finally:
+        if args.keep:
+            print(f"Benchmark catalogs and builds kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, onexc=SAMDconfig.remove_readonly)
+
+    with open(args.output, "w", encoding="UTF-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Saved benchmark results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="UTF-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_to_baseline(
+            results, baseline, args.stages, args.tolerance, args.min_seconds
+        )
+        if regressions:
+            print("Slower than the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,109 +1,109 @@
 #!/usr/bin/env python3
 import SAMDconfig
+import argparse
 import os
-import shutil
+import sys
+
+parser = argparse.ArgumentParser(description="Build the Arduino board package")
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="continue a failed build, skipping the work it already finished",
+)
+# by default every board is built; these pick a subset and reuse the rest from the last build
+parser.add_argument(
+    "--boards", nargs="+", help="only build the boards with these names"
+)
+parser.add_argument(
+    "--chip-family", nargs="+", help="only build the boards with these chip families"
+)
+parser.add_argument(
+    "--changed-since",
+    metavar="GIT_REF",
+    help="only build the boards whose files changed since this git ref",
+)
+parser.add_argument(
+    "--changed",
+    action="store_true",
+    help="only build the boards whose files changed since the last build",
+)
+parser.add_argument(
+    "--serve",
+    metavar="PORT",
+    type=int,
+    nargs="?",
+    const=8765,
+    help="run a build server on localhost (default port 8765) that keeps its state between builds",
+)
+parser.add_argument(
+    "--worker",
+    metavar="PORT",
+    type=int,
+    nargs="?",
+    const=8766,
+    help="run a bootloader worker (default port 8766) for builds with BUILD_WORKERS set",
+)
+parser.add_argument(
+    "--host",
+    default="127.0.0.1",
+    help="address the build server or worker listens on (default 127.0.0.1)",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="build the package, then keep it up to date as the board configs and templates change",
+)
+parser.add_argument(
+    "--check",
+    action="store_true",
+    help="only check the configuration for problems, without building anything",
+)
+args = parser.parse_args()
+
+# the build server reads the package config itself for each build it is asked for
+if args.serve:
+    SAMDconfig.BuildServer("board_data").serve(args.host, args.serve)
+    sys.exit(0)
+
+if args.watch:
+    SAMDconfig.PackageWatcher("board_data").watch()
+    sys.exit(0)
+
+# a bootloader worker uses the package config only for the toolchain and make paths
+if args.worker:
+    worker_package = SAMDconfig.SAMDPackage("board_data")
+    SAMDconfig.BootloaderWorker(
+        worker_package,
+        os.path.join(worker_package.cache_directory(), f"worker-{args.worker}"),
+    ).serve(args.host, args.worker)
+    sys.exit(0)
 
 # Read the package configuration file
 # this will also read all of the board config files and store them in the SAMDPackage object
 print("Reading board config...")
-package = SAMDconfig.SAMDPackage("board_data")
-
-# %%
-# get the latest version of the UF2 repo and check that it is compatible with the board configuration
-print("\nChecking for the latest version of the Adafruit UF-2 Repo")
-package.check_uf2_version()
-
-# setup build directory and move there all source files
-print("\nCopying sources to build directory...")
-package.setup_build_directory()
-
-# Customize the various template files
-print("\nCustomizing all template files")
-package.write_platform_templates()
-
-print("\nCloning the current Adafruit UF2 repo")
-package.clone_uf2_repo()
-
-# %%
-# write config files for bootloader
-print("\nCreating config files for the board bootloaders")
-for board in package.boards_config:
-    bootloader_config_dir = (
-        f"{package.build_directory}/uf2-samdx1/boards/{board.d['board_name']}"
+package = SAMDconfig.SAMDPackage("board_data", check=args.check)
+if args.check:
+    try:
+        package.check_config()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(0)
+package.resume = args.resume
+if args.boards or args.chip_family or args.changed_since or args.changed:
+    package.select_boards(
+        args.boards, args.chip_family, args.changed_since, args.changed
     )
-    os.mkdir(bootloader_config_dir)
-    board.write_board_mk(bootloader_config_dir)
-    board.write_board_config(bootloader_config_dir, package.d)
-
-# %%
-# build bootloader
-print("\nBuilding bootloader...")
-package.build_bootloaders()
-
-# copy built bootloader into the package
-for board in package.boards_config:
-    bootloader_dest = f"{package.package_directory}/bootloaders/{board.name}"
-    os.makedirs(f"{package.package_directory}/bootloaders", exist_ok=True)
-    os.mkdir(bootloader_dest)
-
-    # copy all of the built files into the bootloader directory
-    src_files = os.listdir(board.d["bootloader_dir"])
-    for file_name in src_files:
-        full_file_name = os.path.join(board.d["bootloader_dir"], file_name)
-        if (
-            os.path.isfile(full_file_name)
-            and board.d["bootloader_build_name"] in full_file_name
-            and "map" not in full_file_name
-            and "update" not in full_file_name
-        ):
-            print(f"Copying from {full_file_name} to {full_file_name}")
-            shutil.copy(full_file_name, bootloader_dest)
-            new_filename = (
-                file_name.replace(
-                    board.d["bootloader_build_name"],
-                    board.d["bootloader_versioned_name"],
-                )
-                .replace(
-                    f"{board.d['bootloader_versioned_name']}dirty",
-                    board.d["bootloader_versioned_name"],
-                )
-                .replace(
-                    f"{board.d['bootloader_versioned_name']}+",
-                    board.d["bootloader_versioned_name"],
-                )
-            )
-            # rename from the UF2 version set by make to the configured version
-            print(
-                f"Renaming from {os.path.join(bootloader_dest, file_name)} to {os.path.join(bootloader_dest, new_filename)}"
-            )
-            os.rename(
-                f"{os.path.join(bootloader_dest, file_name)}",
-                f"{os.path.join(bootloader_dest, new_filename)}",
-            )
-
-# # copy all of the built files into the bootloader directory
-# src_files = os.listdir(board.d['bootloader_dir'])
-# for file_name in src_files:
-#     full_file_name = os.path.join(board.d['bootloader_dir'], file_name)
-#     if os.path.isfile(full_file_name):
-#         shutil.copy(full_file_name, bootloader_dest)
-# also, copy the main bin to the top of build directory
-# shutil.copy(f"{board.d['bootloader_dir']}/{board.d['bootloader_build_name']}.bin", board.build_directory)
-
-# compressing directory into zip archive
-print("\nCompressing the package archive")
-package.package_archive()
-
-# create json file
-print("\nCreating json index file")
-package.write_index_json()
 
 
 # %%
-# clean up build directory by removing all cloned and copied files
-print("\nCleaning cloned and copied files from the build directory")
-package.clean_build_directory()
-
+# run the stages of the build: get the latest version of the UF2 repo, set up the build
+# directory, customize the template files, clone the UF2 repo, write the bootloader config
+# files, build the bootloaders and copy them into the package, compress the package archive,
+# create the json index file and clean up the build directory
+# each stage starts as soon as the stages it depends on are done, so independent stages
+# (like the network requests and the template rendering) run at the same time
+package.run_build()
 
 # %%
 print("\nAll done!")